@@ -0,0 +1,256 @@
+"""
+Asynchronous version of posts_mining crawler.
+Tags are crawled concurrently through one pooled aiohttp session,
+all requests share one global token bucket instead of fixed sleeps.
+"""
+
+
+import os
+import json
+import asyncio
+import argparse
+
+import aiohttp
+import pandas as pd
+
+from datamining import telemetry
+from datamining.files import DEFAULT_PATH, POST_TAGS_NAME
+from datamining.store import PostStore
+from datamining.manifest import CrawlManifest
+from datamining.dedup import open_index
+from datamining.throttle import TokenBucket
+from datamining.cache import ResponseCache, use_cache, get_cache, is_offline
+from datamining.posts_mining import BASE_URL, GLOBAL_KEYS, TagWriter, parse_page
+
+
+async def get_json(session, bucket, path, next_page=None, retries=5, base_url=BASE_URL, verbose=False):
+    """
+    Returns json response from url base_url + path
+    :param session: aiohttp.ClientSession
+    :param bucket: datamining.throttle.TokenBucket, limits requests rate
+    :param path: part of url that follows base_url
+    :param next_page: link to next page similar to linked list, got from 'cursor' field in response json
+    :param retries: number of retries to get response from url before skip for next,
+    error statuses are retried too, 429 after Retry-After seconds if server sends them
+    :param base_url: instagram url, could be replaced with local server
+    :param verbose: if true errors information will be printed in stdout
+    :return: json response as dictionary, cached one if datamining.cache.use_cache was called
+    """
+
+    cache = get_cache()
+    if cache is not None:
+        data = cache.get(path, next_page)
+        if data is not None or cache.offline:
+            telemetry.REQUESTS.labels("tag_page", "cached" if data is not None else "not_cached").inc()
+            return data or {}
+
+    url = base_url + path
+    params = {
+        "__a": 1
+    }
+    if next_page:
+        params["max_id"] = next_page
+
+    for retries_counter in range(1, retries + 2):
+        telemetry.SLEEP_SECONDS.labels("rate_limit").inc(await bucket.acquire_async())
+        try:
+            with telemetry.request("tag_page"):
+                async with session.get(url, params=params) as r:
+                    r.raise_for_status()
+                    data = await r.json(content_type=None)
+            if cache is not None and r.status == 200:
+                cache.set(data, path, next_page)
+            return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.decoder.JSONDecodeError) as e:
+            sleep_for = retries_counter * 10
+            if isinstance(e, aiohttp.ClientResponseError) and e.status == 429:
+                retry_after = (e.headers or {}).get("Retry-After", "")
+                if retry_after.isdigit():
+                    sleep_for = int(retry_after)
+            if verbose:
+                print(e, f"\nSleeping for {sleep_for} seconds...")
+            telemetry.RETRIES.labels("tag_page").inc()
+            telemetry.SLEEP_SECONDS.labels("retry").inc(sleep_for)
+            await asyncio.sleep(sleep_for)
+    return {}
+
+
+async def pages_by_tag(session, bucket, tag, max_pages, retries=5, base_url=BASE_URL, next_page=None, page_n=1):
+    """Async instagram pages generator, yields n pages found by hash tag, where n <= max_pages
+
+    session: aiohttp.ClientSession
+    bucket: datamining.throttle.TokenBucket
+    tag: str, instagram hash tag without '#' symbol
+    max_pages: int, max n of pages to yield
+    retries: int, number of attempts to get data from page
+    next_page: str, cursor to start from, got from 'end_cursor' field of previous page
+    page_n: int, number of page next_page points to, used to resume interrupted crawl
+
+    yields: dict"""
+
+    path = f"explore/tags/{tag}/"
+    retries_counter = 0
+
+    while page_n <= max_pages:
+        data = await get_json(session, bucket, path, next_page, base_url=base_url)
+        if page_n == 1 or page_n % 10 == 0:
+            print(f"Got page {page_n} from tag {tag}")
+
+        try:
+            page_info = data["graphql"]["hashtag"]["edge_hashtag_to_media"]["page_info"]
+            retries_counter = 0
+            telemetry.PAGES.inc()
+        except KeyError:
+            if is_offline():
+                print(f"Page is not cached\ncursor: {next_page}")
+                break
+            if retries_counter < retries:
+                retries_counter += 1
+                print(f"Attempt #{retries_counter} on page {page_n}...")
+                telemetry.RETRIES.labels("tag_page").inc()
+                telemetry.SLEEP_SECONDS.labels("retry").inc(retries_counter * 10)
+                await asyncio.sleep(retries_counter * 10)
+                continue
+            else:
+                print(f"Unable to get page data\ncursor: {next_page}")
+                break
+
+        yield data
+
+        if not page_info["has_next_page"]:
+            print(f"Got {page_n} total pages from tag {tag}")
+            break
+        next_page = page_info["end_cursor"]
+        page_n += 1
+
+
+async def get_tag_data(session, bucket, tag, path, max_pages=300, prefix=None, rewrite=False, store=None,
+                       manifest=None, chunk_size=1000, incremental=False, dedup_index=None, base_url=BASE_URL):
+    """Collects data from instagram posts found by tag and dumps it to csv or store,
+    see posts_mining.get_tag_data"""
+
+    links_file = None
+    if dedup_index is not None:
+        links_file = os.path.join(store.root if store is not None else path, POST_TAGS_NAME)
+    writer = TagWriter(tag, os.path.join(path, f"{prefix or tag}.csv"), store=store, manifest=manifest,
+                       chunk_size=chunk_size, incremental=incremental, dedup_index=dedup_index,
+                       links_file=links_file)
+    if not writer.start(rewrite):
+        return
+
+    async for page in pages_by_tag(session, bucket, tag, max_pages, base_url=base_url,
+                                   next_page=writer.end_cursor, page_n=writer.pages + 1):
+        page_info = page["graphql"]["hashtag"]["edge_hashtag_to_media"]["page_info"]
+        page_data = parse_page(page, GLOBAL_KEYS)
+        telemetry.POSTS.inc(len(page_data))
+        if writer.write(page_data, page_info):
+            break
+    writer.close(max_pages)
+
+
+async def crawl_tags(tags, path, max_pages=300, rewrite=False, store=None, manifest=None, chunk_size=1000,
+                     incremental=False, dedup_index=None, concurrency=8, rate=1., burst=1, base_url=BASE_URL):
+    """
+    Crawls tags with 'concurrency' tags at a time, see get_all_posts
+    """
+
+    queue = asyncio.Queue()
+    for index, tag in enumerate(tags):
+        queue.put_nowait((index, tag))
+
+    bucket = TokenBucket(rate, burst)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async def worker():
+        while True:
+            try:
+                index, tag = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            print(f"Collecting data {index + 1} / {len(tags)} for tag {tag}")
+            await get_tag_data(session, bucket, tag, path, max_pages=max_pages, prefix=f"{tag}_{index}",
+                               rewrite=rewrite, store=store, manifest=manifest, chunk_size=chunk_size,
+                               incremental=incremental, dedup_index=dedup_index, base_url=base_url)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def get_all_posts(tags, path=None, max_pages=300, rewrite=False, store=None, manifest=None, chunk_size=1000,
+                  incremental=False, dedup_index=None, concurrency=8, rate=1., burst=1, base_url=BASE_URL):
+    """
+    Dump data searched by instagram tags to path, same output as posts_mining.get_all_posts
+    :param tags: list of instagram hash tags
+    :param path: path to store obtained data, if None stored into './data/posts'
+    :param max_pages: max number of instagram search pages to process
+    :param rewrite: if True files with same names would be rewrited
+    :param store: datamining.store.PostStore, if passed data is appended to store instead of csv files in path
+    :param manifest: datamining.manifest.CrawlManifest, progress of previous runs, finished tags are skipped
+    :param chunk_size: number of posts to dump at once
+    :param incremental: if True only posts newer than stored in previous runs are collected, requires manifest
+    :param dedup_index: datamining.dedup.ShortcodeIndex or BloomFilter, if passed every post is stored once,
+    use files.read_post_tags to get all its tags
+    :param concurrency: number of tags crawled at the same time, also size of connection pool
+    :param rate: max number of requests per second for all tags together
+    :param burst: max number of requests allowed to be sent at once
+    :param base_url: instagram url, could be replaced with local server
+    """
+
+    path = path or DEFAULT_PATH["posts"]
+    os.makedirs(path, exist_ok=True)
+
+    tags = list(tags)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(crawl_tags(tags, path, max_pages=max_pages, rewrite=rewrite, store=store,
+                                           manifest=manifest, chunk_size=chunk_size, incremental=incremental,
+                                           dedup_index=dedup_index, concurrency=concurrency, rate=rate, burst=burst,
+                                           base_url=base_url))
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="""Collects posts data found by hash tags concurrently
+                                                    and stores it in path""")
+    parser.add_argument('tags', help="Path to instagram hash tag csv without '#' symbol")
+    parser.add_argument('path', default=DEFAULT_PATH["posts"], help="Path to store obtained data")
+    parser.add_argument('-p', '--pages', default=300, type=int, help="Max number of pages to process")
+    parser.add_argument('-s', '--store', default=None, help="Path to parquet post store, if passed csv are not written")
+    parser.add_argument('--chunk', default=1000, type=int, help="Number of posts to dump at once")
+    parser.add_argument('--compact', default=None, type=int,
+                        help="Merge part files of store tags having at least this number of them after crawl")
+    parser.add_argument('-i', '--incremental', action="store_true", help="Collect only posts newer than stored ones")
+    parser.add_argument('-d', '--dedup', action="store_true", help="Store every post once for all tags")
+    parser.add_argument('--bloom', default=None, type=int,
+                        help="Expected number of posts, if passed approximate dedup index of fixed size is used")
+    parser.add_argument('--cache', default=None, help="Path to store server responses, cached ones are not requested")
+    parser.add_argument('--cache-ttl', default=None, type=float, help="Seconds to keep cached responses")
+    parser.add_argument('--cache-size', default=None, type=int, help="Max size of cache in bytes")
+    parser.add_argument('--offline', action="store_true", help="Replay cached responses only, requires --cache")
+    parser.add_argument('-c', '--concurrency', default=8, type=int, help="Number of tags crawled at the same time")
+    parser.add_argument('-r', '--rate', default=1., type=float, help="Max number of requests per second")
+    parser.add_argument('--base-url', default=BASE_URL, help="Instagram url, e.g. local stub server for testing")
+    parser.add_argument('--metrics-port', default=None, type=int, help="Port to expose prometheus metrics on")
+    parser.add_argument('--metrics-file', default=None, help="Path to dump metrics to after crawl")
+    args = parser.parse_args()
+
+    tags = pd.read_csv(args.tags, sep=";", header=None)[1].values
+    store = PostStore(args.store) if args.store else None
+    if args.metrics_port:
+        telemetry.serve(args.metrics_port)
+    if args.cache:
+        use_cache(ResponseCache(args.cache, ttl=args.cache_ttl, max_size=args.cache_size, offline=args.offline))
+    os.makedirs(args.path, exist_ok=True)
+    manifest = CrawlManifest.in_folder(args.path)
+    dedup_index = open_index(args.path, bloom=args.bloom) if args.dedup or args.bloom else None
+
+    try:
+        get_all_posts(tags, path=args.path, max_pages=args.pages, store=store, manifest=manifest,
+                      chunk_size=args.chunk, incremental=args.incremental, dedup_index=dedup_index,
+                      concurrency=args.concurrency, rate=args.rate, base_url=args.base_url)
+    finally:
+        if args.metrics_file:
+            telemetry.dump(args.metrics_file)
+    if store is not None and args.compact:
+        store.compact(min_parts=args.compact)
@@ -0,0 +1,114 @@
+"""
+On-disk cache of crawler responses.
+
+Responses are stored as json files named by hash of request key
+(e.g. request path + cursor). Cache set by use_cache is used by
+posts_mining.get_json, aio_posts_mining.get_json and likes_mining.get_post_likes.
+In offline mode nothing is requested from network, so parsing
+could be re-run on cached responses only.
+"""
+
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+CACHE = None
+
+
+class ResponseCache:
+    """
+    Json responses cache with time to live and size bounded eviction of least recently used entries.
+    Could be shared by threads, e.g. likes_mining workers.
+    """
+
+    def __init__(self, path, ttl=None, max_size=None, offline=False):
+        """
+        :param path: folder to store responses in
+        :param ttl: seconds after which response is considered outdated, if None responses never expire
+        :param max_size: max total size of cached files in bytes, if None cache is not bounded
+        :param offline: if True crawlers use cache only and never request network
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._size = sum(e.stat().st_size for e in os.scandir(path) if e.name.endswith(".json"))
+
+    def _file_name(self, key):
+        digest = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{digest}.json")
+
+    def get(self, *key):
+        """
+        Returns cached response or None if it is missing or outdated
+        :param key: json serializable parts of request key
+        """
+        file_name = self._file_name(key)
+        with self._lock:
+            try:
+                with open(file_name, encoding="utf-8") as f:
+                    entry = json.load(f)
+                if self.ttl is not None and time.time() - entry["time"] > self.ttl and not self.offline:
+                    return None
+                os.utime(file_name)  # mark as recently used
+            except (OSError, ValueError):  # e.g. evicted by other process
+                return None
+        return entry["data"]
+
+    def set(self, data, *key):
+        """
+        Stores response, evicts least recently used responses if cache is full
+        :param data: json serializable response
+        :param key: json serializable parts of request key
+        """
+        file_name = self._file_name(key)
+        with self._lock:
+            if os.path.exists(file_name):
+                self._size -= os.path.getsize(file_name)
+            tmp_name = f"{file_name}.tmp"
+            with open(tmp_name, "w", encoding="utf-8") as f:
+                json.dump({"time": time.time(), "key": key, "data": data}, f, ensure_ascii=False)
+            os.replace(tmp_name, file_name)
+            self._size += os.path.getsize(file_name)
+
+            if self.max_size is not None and self._size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Removes least recently used responses until cache size is below 90% of max_size"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+                    except FileNotFoundError:  # removed by other process
+                        pass
+            for _, size, path in sorted(entries):
+                if self._size <= self.max_size * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._size -= size
+
+
+def use_cache(cache):
+    """Sets ResponseCache used by crawlers, None disables caching"""
+    global CACHE
+    CACHE = cache
+
+
+def get_cache():
+    return CACHE
+
+
+def is_offline():
+    return CACHE is not None and CACHE.offline
@@ -0,0 +1,123 @@
+"""
+Persistent indexes of already stored post shortcodes,
+used to store every post once even if it is found by several hash tags.
+"""
+
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+class ShortcodeIndex:
+    """
+    Exact index, keeps all shortcodes in memory, saved ones are appended to text file.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path to text file with one shortcode per line, loaded if exists
+        """
+        self.path = path
+        self._codes = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._codes.update(line.rstrip("\n") for line in f)
+
+    def __contains__(self, code):
+        return code in self._codes
+
+    def __len__(self):
+        return len(self._codes)
+
+    def update(self, codes):
+        """Adds shortcodes to index in memory"""
+        self._codes.update(codes)
+
+    def save(self, codes):
+        """Appends shortcodes to index file, only saved shortcodes are loaded next time"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            for code in codes:
+                f.write(f"{code}\n")
+
+
+class BloomFilter:
+    """
+    Approximate index with fixed memory for large corpora. Bits are kept in memory
+    and written to file on save only, so file never has bits of posts which were not stored.
+    Unknown shortcode could be reported as stored with probability error_rate,
+    such post would be lost, known shortcode is never reported as unknown.
+    """
+
+    def __init__(self, path, capacity=10 ** 7, error_rate=0.001):
+        """
+        :param path: path to bits file, loaded if exists, parameters are stored in path + '.json'
+        :param capacity: expected number of shortcodes, ignored if file exists
+        :param error_rate: false positive probability at full capacity, ignored if file exists
+        """
+        self.path = path
+        meta_path = f"{path}.json"
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        else:
+            n_bits = int(-capacity * np.log(error_rate) / np.log(2) ** 2)
+            meta = {
+                "n_bits": n_bits,
+                "n_hashes": max(1, int(round(n_bits / capacity * np.log(2)))),
+                "size": 0,
+            }
+        self.n_bits = meta["n_bits"]
+        self.n_hashes = meta["n_hashes"]
+        self._size = meta["size"]
+        self._meta_path = meta_path
+
+        n_bytes = (self.n_bits + 7) // 8
+        if os.path.exists(path):
+            self._bits = np.fromfile(path, dtype=np.uint8, count=n_bytes)
+        else:
+            self._bits = np.zeros(n_bytes, dtype=np.uint8)
+
+    def _positions(self, code):
+        digest = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def __contains__(self, code):
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(code))
+
+    def __len__(self):
+        """Approximate number of added shortcodes"""
+        return self._size
+
+    def update(self, codes):
+        """Adds shortcodes to index in memory"""
+        for code in codes:
+            if code in self:
+                continue
+            for p in self._positions(code):
+                self._bits[p >> 3] |= 1 << (p & 7)
+            self._size += 1
+
+    def save(self, codes=None):
+        """Writes all bits to file, codes are already there after update"""
+        tmp_path = f"{self.path}.tmp"
+        self._bits.tofile(tmp_path)
+        os.replace(tmp_path, self.path)
+        with open(f"{self._meta_path}.tmp", "w") as f:
+            json.dump({"n_bits": self.n_bits, "n_hashes": self.n_hashes, "size": self._size}, f)
+        os.replace(f"{self._meta_path}.tmp", self._meta_path)
+
+
+def open_index(path, bloom=None, error_rate=0.001):
+    """
+    Opens shortcode index stored in crawler output folder
+    :param path: folder
+    :param bloom: expected number of posts, if passed BloomFilter is used, else ShortcodeIndex
+    :param error_rate: false positive probability of BloomFilter
+    """
+    if bloom:
+        return BloomFilter(os.path.join(path, "_shortcodes.bloom"), capacity=bloom, error_rate=error_rate)
+    return ShortcodeIndex(os.path.join(path, "_shortcodes.txt"))
@@ -5,7 +5,9 @@ import pandas as pd
 DEFAULT_PATH = {
     "posts": "./data/posts/",
     "likes": "./data/likes",
+    "store": "./data/store/",
 }
+POST_TAGS_NAME = "_post_tags.csv"  # (post_id, tag) pairs of all tags post was found by
 
 
 def merge_csv(path, verbose=False):
@@ -13,6 +15,8 @@ def merge_csv(path, verbose=False):
     table = []
 
     for file_name in next(os.walk(path))[2]:
+        if not file_name.endswith(".csv") or file_name.startswith("_"):
+            continue
         next_table = pd.read_csv(os.path.join(path, file_name), sep=";", engine="python", encoding="utf-8")
         next_table["by_tag"] = file_name.split("_")[0]
         if verbose:
@@ -20,3 +24,34 @@ def merge_csv(path, verbose=False):
         table.append(next_table)
 
     return pd.concat(table, sort=False)
+
+
+def csv_to_store(path, store, verbose=False):
+    """
+    Moves csv tables (csv batches) from path into datamining.store.PostStore,
+    one append per file, so it has to be done only once per crawl
+    :param path: folder with csv batches
+    :param store: datamining.store.PostStore instance
+    :return: number of written rows
+    """
+    written = 0
+    for file_name in next(os.walk(path))[2]:
+        if not file_name.endswith(".csv") or file_name.startswith("_"):
+            continue
+        if verbose:
+            print(f"Storing table: {file_name}")
+        table = pd.read_csv(os.path.join(path, file_name), sep=";", encoding="utf-8")
+        tag = file_name[:-len(".csv")].rsplit("_", 1)[0]  # files are named <tag>_<index>.csv, tag could contain '_'
+        table["by_tag"] = table["by_tag"].fillna(tag) if "by_tag" in table else tag
+        written += store.append(table)
+    return written
+
+
+def read_post_tags(path):
+    """
+    Reads tags of posts stored once with dedup index, see posts_mining.get_all_posts
+    :param path: folder with csv batches or post store root
+    :return: pandas.Series, list of tags by post_id
+    """
+    links = pd.read_csv(os.path.join(path, POST_TAGS_NAME), sep=";", encoding="utf-8")
+    return links.drop_duplicates().groupby("post_id")["tag"].apply(list)
@@ -2,7 +2,8 @@ import os
 import time
 import random
 import argparse
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from instagram.entities import Media
@@ -10,74 +11,144 @@ from instagram.agents import WebAgent
 from instagram.exceptions import InternetException
 from requests.exceptions import ConnectionError
 
+from datamining import telemetry
 from datamining.files import DEFAULT_PATH
+from datamining.likes_store import LikesShardWriter
+from datamining.manifest import CrawlManifest
+from datamining.cache import ResponseCache, use_cache, get_cache
+from datamining.throttle import AIMDLimiter
 
 
 AG = WebAgent()
 
 
-def get_post_likes(shortcode: str):
+def user_id(user):
+    """Returns str identifier of instagram.entities.Account"""
+    return getattr(user, "username", None) or getattr(user, "login", None) or str(user)
+
+
+def get_post_likes(shortcode: str, agent=None, limiter=None):
     """
-    Collects likes from instagram post by shortcode
+    Collects likes from instagram post by shortcode,
+    pages of likes are taken from cache if datamining.cache.use_cache was called
+    :param shortcode: str, post shortcode
+    :param agent: instagram.agents.WebAgent, if None global agent is used
+    :param limiter: datamining.throttle.AIMDLimiter shared by workers, if None random delays are used
+    :return: set of str, ids of users who liked the post
+    :raises: InternetException if post was not found,
+    last connection error if no likes were collected after all attempts
     """
 
+    agent = agent or AG
+    cache = get_cache()
     media = Media(shortcode)
+    likes = set()
     pointer = None
+    error = None
     for i in range(3):
-        time.sleep(random.random() * 2)
+        if cache is not None:
+            cached = cache.get("likes", shortcode, pointer)
+            telemetry.REQUESTS.labels("likes", "cached" if cached is not None else "not_cached").inc()
+            if cached is not None:
+                users, pointer = cached
+                likes.update(users)
+                if pointer is None:
+                    break
+                continue
+            if cache.offline:
+                break
+
+        if limiter is not None:
+            telemetry.SLEEP_SECONDS.labels("rate_limit").inc(limiter.acquire())
+        else:
+            telemetry.sleep(random.random() * 2, "random_delay")
         try:
-            likes, pointer = AG.get_likes(media, pointer)
-            # if pointer is None:
-            #     return media.likes
+            with telemetry.request("likes"):
+                users, next_pointer = agent.get_likes(media, pointer)
+            users = [user_id(user) for user in users]
+            telemetry.LIKES.inc(len(users))
+            if cache is not None:
+                cache.set((users, next_pointer), "likes", shortcode, pointer)
+            if limiter is not None:
+                limiter.success()
+            likes.update(users)
+            pointer = next_pointer
+            if pointer is None:
+                break
         except (ConnectionError, InternetException) as e:
-            delay = random.randint(20, 100)
-            if not ("404" in repr(e)):
+            if "404" in repr(e):
+                raise
+            error = e
+            telemetry.RETRIES.labels("likes").inc()
+            if limiter is not None:
+                limiter.failure()
+            else:
+                delay = random.randint(20, 100)
                 print(e, f"Sleep for {delay} sec...")
-                time.sleep(delay)
-    return media.likes
+                telemetry.sleep(delay, "retry")
+
+    if error is not None and not likes:
+        raise error
+    return likes
+
+
+_local = threading.local()
+
 
+def _collect_likes(shortcode, limiter):
+    """Runs in worker thread, every worker uses its own WebAgent session"""
+    if not hasattr(_local, "agent"):
+        _local.agent = WebAgent()
+    try:
+        return shortcode, get_post_likes(shortcode, agent=_local.agent, limiter=limiter), None
+    except Exception as e:
+        return shortcode, None, e
 
-def get_all_likes(posts, path, start=0, stop=None, batch=500):
+
+def get_all_likes(posts, path, start=0, stop=None, batch=500, manifest=None, workers=1, rate=None):
     """
-    Collect likes data for given post shortcodes and stores it in format "likes_{batch_start}_{batch_stop}.csv"
+    Collect likes data for given post shortcodes and stores it as sparse shards "likes_{batch_start}_{batch_stop}.npz",
+    see datamining.likes_store, use datamining.likes_store.load_likes to read them
     :param posts: iterable, posts shortcodes
-    :param path: str, path to folder, which will contain result data csv
+    :param path: str, path to folder, which will contain result data
     :param start: index of posts to start iterate over
     :param stop: index + 1 to stop iterate, if None - posts len will be used
-    :param batch: number of posts which data will be stored in separate csv file
+    :param batch: number of posts which data will be stored in separate shard
+    :param manifest: datamining.manifest.CrawlManifest, posts stored in previous runs are skipped,
+    stored and failed posts are marked there after every shard dump
+    :param workers: number of threads collecting likes, each with its own session
+    :param rate: max number of requests per second for all workers, adapted to errors with AIMD rule,
+    if None each worker sleeps randomly before every request
     """
 
     stop = stop or len(posts)
-    likes = []
+    writer = LikesShardWriter(path)
+    limiter = AIMDLimiter(rate) if rate else None
     start_time = time.time()
-    batch_start, batch_stop = start, start + batch
-
-    # iterate over posts
-    for i, p in enumerate(posts[start:stop], start=start):
-        print(f"Collecting likes from {p} #{i}")
-        try:
-            gathered_likes = get_post_likes(p)
-            if gathered_likes:
-                post_df = pd.DataFrame({user: 1 for user in gathered_likes}, index=[p])
-                likes.append(post_df)
-                print("Done")
-            else:
-                print("Fail")
-        except Exception as e:
-            print(e)
-            continue
 
-        if i == batch_stop:
-            likes_df = pd.concat(likes, sort=False)
-            likes_df.to_csv(os.path.join(path, f"likes_{batch_start}_{batch_stop}.csv"), sep=";", index_label="post_id")
-
-            batch_start, batch_stop = i, i + batch
-            likes = []
-
-    # Adding last batch
-    if likes:
-        likes_df = pd.concat(likes, sort=False)
-        likes_df.to_csv(os.path.join(path, f"likes_{batch_start}_{stop}.csv"), sep=";", index_label="post_id")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch_start in range(start, stop, batch):
+            batch_stop = min(batch_start + batch, stop)
+            todo = [p for p in posts[batch_start:batch_stop] if manifest is None or p not in manifest.shortcodes]
+
+            collected = []
+            for p, gathered_likes, error in pool.map(_collect_likes, todo, [limiter] * len(todo)):
+                if gathered_likes:
+                    writer.add(p, gathered_likes)
+                    collected.append(p)
+                    print(f"Collected likes from {p}")
+                else:
+                    error = error or "no likes"
+                    print(f"Failed to collect likes from {p}: {error}")
+                    if manifest is not None:
+                        manifest.mark_failed(p, repr(error))
+
+            if collected:
+                with telemetry.write("likes_shard", len(writer)):
+                    writer.flush(f"likes_{batch_start}_{batch_stop}")
+            if manifest is not None:
+                manifest.mark_shortcodes(collected)
+                manifest.save()
 
     print(f"Finished after {time.time() - start_time}")
 
@@ -91,13 +162,27 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--batch', default=200, type=int, help="Max number posts to dump in single file")
     parser.add_argument('--start', default=0, type=int, help="Start index in posts shortcodes array")
     parser.add_argument('--stop', default=None, type=int, help="Stop index in posts shortcodes array")
+    parser.add_argument('-w', '--workers', default=1, type=int, help="Number of concurrent sessions")
+    parser.add_argument('-r', '--rate', default=None, type=float,
+                        help="Max number of requests per second for all sessions, adapted to errors")
+    parser.add_argument('--cache', default=None, help="Path to store server responses, cached ones are not requested")
+    parser.add_argument('--cache-ttl', default=None, type=float, help="Seconds to keep cached responses")
+    parser.add_argument('--cache-size', default=None, type=int, help="Max size of cache in bytes")
+    parser.add_argument('--offline', action="store_true", help="Replay cached responses only, requires --cache")
+    parser.add_argument('--metrics-port', default=None, type=int, help="Port to expose prometheus metrics on")
+    parser.add_argument('--metrics-file', default=None, help="Path to dump metrics to after crawl")
     args = parser.parse_args()
 
-    if not os.path.exists(DEFAULT_PATH["likes"]):
+    if args.metrics_port:
+        telemetry.serve(args.metrics_port)
+    if args.cache:
+        use_cache(ResponseCache(args.cache, ttl=args.cache_ttl, max_size=args.cache_size, offline=args.offline))
+
+    if not os.path.exists(args.path):
         try:
-            os.makedirs(DEFAULT_PATH["likes"])
+            os.makedirs(args.path)
         except OSError as e:
-            print(f"Unable to access directory:\n{DEFAULT_PATH['likes']}")
+            print(f"Unable to access directory:\n{args.path}")
             raise e
 
     posts = pd.read_csv(args.posts, sep=";", header=None)
@@ -106,4 +191,10 @@ if __name__ == '__main__':
     else:
         posts = posts[1].values
 
-    get_all_likes(posts, args.path, start=args.start, stop=args.stop, batch=args.batch)
+    manifest = CrawlManifest.in_folder(args.path)
+    try:
+        get_all_likes(posts, args.path, start=args.start, stop=args.stop, batch=args.batch, manifest=manifest,
+                      workers=args.workers, rate=args.rate)
+    finally:
+        if args.metrics_file:
+            telemetry.dump(args.metrics_file)
@@ -0,0 +1,118 @@
+"""
+Sparse storage for likes data.
+
+Likes are kept as shards of (post_id, user_id) integer pairs in .npz files,
+ids are interned in 'posts.vocab' and 'users.vocab' files shared by all
+shards in the folder, so shards could be stacked into one scipy.sparse matrix.
+"""
+
+
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from utils.vocabulary import Vocabulary
+
+
+POSTS_VOCAB = "posts.vocab"
+USERS_VOCAB = "users.vocab"
+
+
+class LikesShardWriter:
+    """
+    Accumulates likes as COO pairs and dumps them to .npz shards.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: folder to store shards and vocabularies in, vocabularies are loaded if exist
+        """
+        self.path = path
+        self.posts = Vocabulary.load(os.path.join(path, POSTS_VOCAB))
+        self.users = Vocabulary.load(os.path.join(path, USERS_VOCAB))
+        self._saved = {POSTS_VOCAB: len(self.posts), USERS_VOCAB: len(self.users)}
+        self._rows = []
+        self._cols = []
+
+    def __len__(self):
+        """Number of not flushed likes"""
+        return sum(len(r) for r in self._rows)
+
+    def add(self, post, users):
+        """
+        Adds likes of single post
+        :param post: str, post shortcode
+        :param users: iterable of str, users who liked the post
+        """
+        cols = self.users.update(users)
+        self._rows.append(np.full(len(cols), self.posts.add(post), dtype=np.int32))
+        self._cols.append(np.asarray(cols, dtype=np.int32))
+
+    def flush(self, name):
+        """
+        Writes accumulated likes to '<name>.npz' shard and new vocabulary items to vocabulary files
+        :param name: shard name without extension, e.g. 'likes_0_500'
+        :return: path to shard
+        """
+        # vocabularies go first, so every stored shard id could be resolved
+        for file_name, vocab in ((POSTS_VOCAB, self.posts), (USERS_VOCAB, self.users)):
+            vocab.save(os.path.join(self.path, file_name), start=self._saved[file_name])
+            self._saved[file_name] = len(vocab)
+
+        rows = np.concatenate(self._rows) if self._rows else np.empty(0, dtype=np.int32)
+        cols = np.concatenate(self._cols) if self._cols else np.empty(0, dtype=np.int32)
+        shard = os.path.join(self.path, f"{name}.npz")
+        n = 0
+        while os.path.exists(shard):  # resumed crawl could produce the same batch name
+            n += 1
+            shard = os.path.join(self.path, f"{name}_{n}.npz")
+        np.savez_compressed(shard, row=rows, col=cols)
+
+        self._rows, self._cols = [], []
+        return shard
+
+
+def load_likes(path):
+    """
+    Assembles all likes shards from path into one matrix
+    :param path: folder with shards written by LikesShardWriter
+    :return: (scipy.sparse.csr_matrix of shape n_posts x n_users with 1 for every like,
+              posts Vocabulary, users Vocabulary)
+    """
+    posts = Vocabulary.load(os.path.join(path, POSTS_VOCAB))
+    users = Vocabulary.load(os.path.join(path, USERS_VOCAB))
+
+    rows, cols = [], []
+    for file_name in sorted(next(os.walk(path))[2]):
+        if not file_name.endswith(".npz"):
+            continue
+        with np.load(os.path.join(path, file_name)) as shard:
+            rows.append(shard["row"])
+            cols.append(shard["col"])
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int32)
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(posts), len(users)))
+    matrix.data[:] = 1  # same post could be stored in several shards
+    return matrix, posts, users
+
+
+def csv_to_shards(path, verbose=False):
+    """
+    Converts wide "likes_{start}_{stop}.csv" tables (post_id x user) from path to sparse shards in the same folder
+    :param path: folder with likes csv tables
+    :return: LikesShardWriter used for conversion
+    """
+    writer = LikesShardWriter(path)
+    for file_name in sorted(next(os.walk(path))[2]):
+        if not (file_name.startswith("likes_") and file_name.endswith(".csv")):
+            continue
+        if verbose:
+            print(f"Converting table: {file_name}")
+        table = pd.read_csv(os.path.join(path, file_name), sep=";", index_col="post_id")
+        for post, row in table.iterrows():
+            writer.add(post, row.index[row.notnull()])
+        writer.flush(file_name[:-len(".csv")])
+    return writer
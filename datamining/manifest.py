@@ -0,0 +1,122 @@
+"""
+Persistent progress of crawlers, lets interrupted crawls resume where they stopped.
+"""
+
+
+import os
+import json
+
+
+MANIFEST_NAME = "_manifest.json"
+KNOWN_LIMIT = 1000  # number of newest shortcodes kept per tag to recognize ingested posts
+
+
+class CrawlManifest:
+    """
+    Json file with crawl progress:
+        shortcodes - posts which likes are already stored
+        failed - {shortcode: error} posts which likes could not be collected in the last attempt
+        tags - hash tags which posts are fully stored
+        cursors - {tag: {"end_cursor": str, "pages": int}} last stored page of unfinished tags
+        watermarks - {tag: {"timestamp": int, "shortcodes": {shortcode: timestamp}}} newest stored posts
+        of finished tags, used by incremental crawl
+        pending - {tag: {shortcode: timestamp}} newest stored posts of unfinished tags,
+        moved to watermarks when tag is finished
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path to json file, loaded if exists
+        """
+        self.path = path
+        self.shortcodes = set()
+        self.failed = {}
+        self.tags = set()
+        self.cursors = {}
+        self.watermarks = {}
+        self.pending = {}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.shortcodes.update(state.get("shortcodes", []))
+            self.failed.update(state.get("failed", {}))
+            self.tags.update(state.get("tags", []))
+            self.cursors.update(state.get("cursors", {}))
+            self.watermarks.update(state.get("watermarks", {}))
+            self.pending.update(state.get("pending", {}))
+
+    @classmethod
+    def in_folder(cls, path):
+        """Manifest stored in crawler output folder"""
+        return cls(os.path.join(path, MANIFEST_NAME))
+
+    def save(self):
+        """Atomically dumps state to file"""
+        state = {
+            "shortcodes": sorted(self.shortcodes),
+            "failed": self.failed,
+            "tags": sorted(self.tags),
+            "cursors": self.cursors,
+            "watermarks": self.watermarks,
+            "pending": self.pending,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def mark_shortcodes(self, shortcodes):
+        self.shortcodes.update(shortcodes)
+        for code in shortcodes:
+            self.failed.pop(code, None)
+
+    def mark_failed(self, shortcode, error):
+        self.failed[shortcode] = error
+
+    def cursor(self, tag):
+        """Returns (end_cursor, number of stored pages) of tag, (None, 0) if tag was not started"""
+        state = self.cursors.get(tag, {})
+        return state.get("end_cursor"), state.get("pages", 0)
+
+    def set_cursor(self, tag, end_cursor, pages):
+        self.cursors[tag] = {"end_cursor": end_cursor, "pages": pages}
+
+    def watermark(self, tag):
+        """Returns (timestamp of the newest stored post or None, {shortcode: timestamp} of newest stored posts)"""
+        state = self.watermarks.get(tag, {})
+        return state.get("timestamp"), state.get("shortcodes", {})
+
+    def add_posts(self, tag, posts):
+        """
+        Remembers stored posts of unfinished tag
+        :param posts: dict {shortcode: taken_at_timestamp}
+        """
+        self.pending[tag] = _newest({**self.pending.get(tag, {}), **posts})
+
+    def mark_tag(self, tag):
+        """Marks tag as finished, moves its pending posts to watermark"""
+        self.tags.add(tag)
+        self.cursors.pop(tag, None)
+        pending = self.pending.pop(tag, {})
+        if pending:
+            known = _newest({**self.watermark(tag)[1], **pending})
+            self.watermarks[tag] = {"timestamp": max(known.values()), "shortcodes": known}
+
+    def reopen_tag(self, tag):
+        """Marks finished tag as unfinished keeping its watermark, used by incremental crawl"""
+        if tag in self.tags:
+            self.tags.discard(tag)
+            self.cursors.pop(tag, None)
+
+    def reset_tag(self, tag):
+        self.tags.discard(tag)
+        self.cursors.pop(tag, None)
+        self.watermarks.pop(tag, None)
+        self.pending.pop(tag, None)
+
+
+def _newest(posts, limit=KNOWN_LIMIT):
+    if len(posts) <= limit:
+        return posts
+    return dict(sorted(posts.items(), key=lambda x: x[1], reverse=True)[:limit])
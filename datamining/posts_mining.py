@@ -5,15 +5,20 @@ before I have found 'instagram' library, so it is hardcoded a little
 
 
 import json
-import time
 import argparse
 import os
 
 import requests
 import pandas as pd
 
-from datamining.files import DEFAULT_PATH
+from datamining import telemetry
+from datamining.files import DEFAULT_PATH, POST_TAGS_NAME
+from datamining.store import PostStore
+from datamining.manifest import CrawlManifest
+from datamining.dedup import open_index
+from datamining.cache import ResponseCache, use_cache, get_cache, is_offline
 
+BASE_URL = "https://www.instagram.com/"
 GLOBAL_VERBOSE = True
 GLOBAL_KEYS = [
     "text",
@@ -22,6 +27,7 @@ GLOBAL_KEYS = [
     "owner",
     "is_video"
 ]
+POST_COLUMNS = ["post_id", "text", "date", "likes", "owner_id", "is_video", "by_tag"]
 
 
 def get_json(path, next_page=None, retries=5, verbose=False):
@@ -31,10 +37,17 @@ def get_json(path, next_page=None, retries=5, verbose=False):
     :param next_page: link to next page similar to linked list, got from 'cursor' field in response json
     :param retries: number of retries to get response from url before skip for next
     :param verbose: if true errors information will be printed in stdout
-    :return: json response as dictionary
+    :return: json response as dictionary, cached one if datamining.cache.use_cache was called
     """
 
-    url = "https://www.instagram.com/" + path
+    cache = get_cache()
+    if cache is not None:
+        data = cache.get(path, next_page)
+        if data is not None or cache.offline:
+            telemetry.REQUESTS.labels("tag_page", "cached" if data is not None else "not_cached").inc()
+            return data or {}
+
+    url = BASE_URL + path
     params = {
         "__a": 1
     }
@@ -45,35 +58,41 @@ def get_json(path, next_page=None, retries=5, verbose=False):
 
     while retries_counter <= retries:
         try:
-            r = requests.get(url, params=params)
+            with telemetry.request("tag_page"):
+                r = requests.get(url, params=params)
+                data = r.json()
             retries_counter = 0
-            return r.json()
+            if cache is not None and r.ok:
+                cache.set(data, path, next_page)
+            return data
         except OSError as e:
             retries_counter += 1
             sleep_for = retries_counter * 10
             if verbose:
                 print(e, f"\nSleeping for {sleep_for} seconds...")
-            time.sleep(sleep_for)
+            telemetry.RETRIES.labels("tag_page").inc()
+            telemetry.sleep(sleep_for, "retry")
         except json.decoder.JSONDecodeError as e:
             retries_counter += 1
             sleep_for = retries_counter * 10
             if verbose:
                 print(e, f"\nSleeping for {sleep_for} seconds...")
-            time.sleep(sleep_for)
+            telemetry.RETRIES.labels("tag_page").inc()
+            telemetry.sleep(sleep_for, "retry")
     return {}
 
 
-def pages_by_tag(tag, max_pages, retries=5):
+def pages_by_tag(tag, max_pages, retries=5, next_page=None, page_n=1):
     """Instagram pages generator, yields n pages found by hash tag, where n <= max_pages
 
     tag: str, instagram hash tag without '#' symbol
     max_pages: int, max n of pages to yield
     retries: int, number of attempts to get data from page
+    next_page: str, cursor to start from, got from 'end_cursor' field of previous page
+    page_n: int, number of page next_page points to, used to resume interrupted crawl
 
     yields: dict"""
 
-    next_page = None
-    page_n = 1
     path = f"explore/tags/{tag}/"
     retries_counter = 0
 
@@ -85,12 +104,16 @@ def pages_by_tag(tag, max_pages, retries=5):
         try:
             page_info = data["graphql"]["hashtag"]["edge_hashtag_to_media"]["page_info"]
             retries_counter = 0
+            telemetry.PAGES.inc()
         except KeyError:
+            if is_offline():
+                print(f"Page is not cached\ncursor: {next_page}")
+                break
             if retries_counter <= retries:
-                time.sleep(1)
                 print(f"Attempt #{retries_counter} on page {page_n}...")
                 retries_counter += 1
-                time.sleep(retries_counter * 10)
+                telemetry.RETRIES.labels("tag_page").inc()
+                telemetry.sleep(1 + retries_counter * 10, "retry")
                 continue
             else:
                 print(f"Unable to get page data\ncursor: {next_page}")
@@ -107,7 +130,7 @@ def pages_by_tag(tag, max_pages, retries=5):
         page_n += 1
 
         yield data
-    
+
 
 def parse_page(page_json, keys, verbose=False):
     """Parses instagram page json
@@ -137,12 +160,190 @@ def parse_page(page_json, keys, verbose=False):
     return parsed_data
 
 
-def get_tag_data(tag, path, max_pages=300, dump=False, prefix=None, rewrite=False):
+def parsed_pages(pages, keys=GLOBAL_KEYS, delay=0):
+    """Lazily parses pages one by one
+
+    pages: iterable of page json, e.g. pages_by_tag generator
+    keys: iterable, list of fields to retrieve from page json
+    delay: seconds to sleep after each page
+
+    yields: (dict with pairs <post_shortcode>: {<post_data>}, page_info dict with 'end_cursor' and 'has_next_page')"""
+
+    for page in pages:
+        page_data = parse_page(page, keys)
+        telemetry.POSTS.inc(len(page_data))
+        yield page_data, page["graphql"]["hashtag"]["edge_hashtag_to_media"]["page_info"]
+        if delay:
+            telemetry.sleep(delay, "page_delay")
+
+
+class TagWriter:
+    """
+    Dumps posts of single tag to csv file or PostStore in chunks of about chunk_size rows as pages arrive,
+    so memory does not depend on number of pages. Cursor of the last dumped page is stored in CrawlManifest,
+    so crawl could be resumed.
+    In incremental mode only posts newer than the tag watermark from CrawlManifest are dumped and paging
+    stops on the first page with already stored posts.
+    With shortcode index posts already stored by other tags are not dumped again, instead every
+    (post_id, tag) pair is appended to links file.
+    """
+
+    def __init__(self, tag, file_name, store=None, manifest=None, chunk_size=1000, incremental=False,
+                 dedup_index=None, links_file=None):
+        """
+        :param tag: str, instagram hash tag without '#' symbol
+        :param file_name: csv file to write, not used if store is passed
+        :param store: datamining.store.PostStore
+        :param manifest: datamining.manifest.CrawlManifest
+        :param chunk_size: number of rows to collect before dump, whole pages are dumped,
+        so chunk could exceed it by less than one page
+        :param incremental: if True only new posts are collected, requires manifest
+        :param dedup_index: datamining.dedup.ShortcodeIndex or BloomFilter shared by all tags
+        :param links_file: csv file to append (post_id, tag) pairs to, requires dedup_index
+        """
+        if incremental and manifest is None:
+            raise ValueError("Incremental mode requires manifest")
+        if (dedup_index is None) != (links_file is None):
+            raise ValueError("Dedup_index and links_file should be passed together")
+        self.tag = tag
+        self.file_name = file_name
+        self.store = store
+        self.manifest = manifest
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.since, self.known = None, {}
+        self.index = dedup_index
+        self.links_file = links_file
+        self.end_cursor = None
+        self.pages = 0
+        self.has_next = True
+        self._chunk = {}
+        self._chunk_pages = 0
+        self._seen = {}
+        self._rewrite = False
+
+    def start(self, rewrite=False):
+        """
+        Restores progress from manifest and prepares output
+        :param rewrite: if True tag is collected from the first page, posts found in dedup_index are
+        stored again, since the index could not tell posts of this tag from posts of other tags
+        :return: False if tag was already collected
+        """
+        self._rewrite = rewrite
+        if self.manifest is not None:
+            if rewrite:
+                self.manifest.reset_tag(self.tag)
+            elif self.incremental:
+                self.manifest.reopen_tag(self.tag)
+            elif self.tag in self.manifest.tags:
+                return False
+            self.end_cursor, self.pages = self.manifest.cursor(self.tag)
+            self.since, self.known = self.manifest.watermark(self.tag)
+
+        if self.incremental:
+            return True
+        if self.pages == 0 and self.store is None and os.path.exists(self.file_name):
+            if not rewrite:  # collected before manifest was used
+                if self.manifest is not None:
+                    self.manifest.mark_tag(self.tag)
+                    self.manifest.save()
+                return False
+            os.remove(self.file_name)
+        return True
+
+    def write(self, page_data, page_info):
+        """
+        Adds parsed page to current chunk, dumps chunk if it is full
+        :param page_data: dict, result of parse_page
+        :param page_info: dict, 'page_info' field of page json
+        :return: True if page contains already stored posts in incremental mode, so next pages should not be fetched
+        """
+        reached = False
+        if self.incremental:
+            new_data = {code: post for code, post in page_data.items() if not self._is_stored(code, post)}
+            reached = len(new_data) < len(page_data)
+            page_data = new_data
+
+        self._seen.update((code, post.get("taken_at_timestamp")) for code, post in page_data.items())
+        if self.index is not None:
+            if not self._rewrite:
+                page_data = {code: post for code, post in page_data.items() if code not in self.index}
+            self.index.update(page_data)
+
+        self._chunk.update(page_data)
+        self._chunk_pages += 1
+        self.end_cursor = page_info["end_cursor"]
+        self.has_next = page_info["has_next_page"] and not reached
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+        return reached
+
+    def _is_stored(self, code, post):
+        timestamp = post.get("taken_at_timestamp")
+        return code in self.known or (None not in (self.since, timestamp) and timestamp < self.since)
+
+    def consume(self, pages):
+        """Writes (page_data, page_info) pairs from parsed_pages generator until stored posts are reached
+        and dumps the rest"""
+        for page_data, page_info in pages:
+            if self.write(page_data, page_info):
+                break
+        self.flush()
+
+    def flush(self):
+        """Dumps current chunk and remembers cursor of its last page"""
+        if not self._chunk_pages:
+            return
+        if self._chunk:
+            df = json_to_df(self._chunk, self.tag)
+            with telemetry.write("csv" if self.store is None else "store", len(df)):
+                if self.store is not None:
+                    self.store.append(df)
+                else:
+                    header = not os.path.exists(self.file_name)
+                    df.reindex(columns=POST_COLUMNS).to_csv(self.file_name, sep=";", index=False, mode="a",
+                                                            header=header)
+
+        if self.index is not None:
+            self.index.save(self._chunk)
+            header = not os.path.exists(self.links_file)
+            with open(self.links_file, "a", encoding="utf-8") as f:
+                if header:
+                    f.write("post_id;tag\n")
+                for code in self._seen:
+                    f.write(f"{code};{self.tag}\n")
+
+        self.pages += self._chunk_pages
+        if self.manifest is not None:
+            self.manifest.add_posts(self.tag, {code: ts for code, ts in self._seen.items() if ts is not None})
+        self._seen = {}
+        self._chunk = {}
+        self._chunk_pages = 0
+        if self.manifest is not None:
+            self.manifest.set_cursor(self.tag, self.end_cursor, self.pages)
+            self.manifest.save()
+
+    def close(self, max_pages):
+        """Dumps the rest and marks tag as finished in manifest if all pages or max_pages were collected"""
+        self.flush()
+        if self.manifest is not None and (not self.has_next or self.pages >= max_pages):
+            self.manifest.mark_tag(self.tag)
+            self.manifest.save()
+
+
+def get_tag_data(tag, path, max_pages=300, dump=False, prefix=None, rewrite=False, store=None, manifest=None,
+                 chunk_size=1000, incremental=False, dedup_index=None):
     """Collects data from instagram posts found by tag
 
     tag: str, instagram hash tag without '#' symbol
     keys: fields from instagram response json to retrieve
     max_pages: int, max n of pages to parse
+    store: datamining.store.PostStore, if passed and dump is True data is appended to store instead of csv
+    manifest: datamining.manifest.CrawlManifest, if passed and dump is True crawl is resumed from last stored page
+    chunk_size: int, if dump is True posts are dumped by chunks of that size as pages arrive
+    incremental: bool, if True and dump is True only posts newer than stored ones are collected, requires manifest
+    dedup_index: datamining.dedup.ShortcodeIndex or BloomFilter, if passed and dump is True posts stored by other tags
+    are skipped, all tags of posts are written to files.POST_TAGS_NAME file
 
     returns: dict, with pairs <post_shortcode>: {<post_data>}"""
 
@@ -151,19 +352,23 @@ def get_tag_data(tag, path, max_pages=300, dump=False, prefix=None, rewrite=Fals
     else:
         file_name = os.path.join(path, f"{tag}.csv")
 
-    if dump and not rewrite and os.path.exists(file_name):
+    if dump:
+        links_file = None
+        if dedup_index is not None:
+            links_file = os.path.join(store.root if store is not None else path, POST_TAGS_NAME)
+        writer = TagWriter(tag, file_name, store=store, manifest=manifest, chunk_size=chunk_size,
+                           incremental=incremental, dedup_index=dedup_index, links_file=links_file)
+        if not writer.start(rewrite):
+            return
+        pages = pages_by_tag(tag, max_pages, next_page=writer.end_cursor, page_n=writer.pages + 1)
+        writer.consume(parsed_pages(pages, delay=0 if is_offline() else 2))
+        writer.close(max_pages)
         return
 
     tag_data = {}
-    for page in pages_by_tag(tag, max_pages):
-        time.sleep(2)
-        page_data = parse_page(page, GLOBAL_KEYS)
+    for page_data, _ in parsed_pages(pages_by_tag(tag, max_pages), delay=0 if is_offline() else 2):
         tag_data.update(page_data)
-
-    if dump:
-        json_to_df(tag_data, tag).to_csv(file_name, sep=";", index=False)
-    else:
-        return tag_data
+    return tag_data
 
 
 def json_to_df(json_data, tag):
@@ -181,13 +386,20 @@ def json_to_df(json_data, tag):
     return df
 
 
-def get_all_posts(tags, path=None, max_pages=300, rewrite=False):
+def get_all_posts(tags, path=None, max_pages=300, rewrite=False, store=None, manifest=None, chunk_size=1000,
+                  incremental=False, dedup_index=None):
     """
     Dump data searched by instagram tags to path
     :param tags: list of instagram hash tags or path to csv file with tags
     :param path: path to store obtained data, if None stored into './data/posts'
     :param max_pages: max number of instagram search pages to process
     :param rewrite: if True files with same names would be rewrited
+    :param store: datamining.store.PostStore, if passed data is appended to store instead of csv files in path
+    :param manifest: datamining.manifest.CrawlManifest, progress of previous runs, finished tags are skipped
+    :param chunk_size: number of posts to dump at once
+    :param incremental: if True only posts newer than stored in previous runs are collected, requires manifest
+    :param dedup_index: datamining.dedup.ShortcodeIndex or BloomFilter, if passed every post is stored once,
+    use files.read_post_tags to get all its tags
     """
 
     path = path or DEFAULT_PATH["posts"]
@@ -202,7 +414,8 @@ def get_all_posts(tags, path=None, max_pages=300, rewrite=False):
     for index, tag in enumerate(tags):
         prefix = f"{tag}_{index}"
         print(f"Collecting data {index + 1} / {len(tags)} for tag {tag}")
-        get_tag_data(tag, dump=True, path=path, prefix=prefix, max_pages=max_pages, rewrite=rewrite)
+        get_tag_data(tag, dump=True, path=path, prefix=prefix, max_pages=max_pages, rewrite=rewrite, store=store,
+                     manifest=manifest, chunk_size=chunk_size, incremental=incremental, dedup_index=dedup_index)
 
 
 if __name__ == '__main__':
@@ -211,6 +424,20 @@ if __name__ == '__main__':
     parser.add_argument('tags', help="Path to instagram hash tag csv without '#' symbol")
     parser.add_argument('path', default=DEFAULT_PATH["posts"], help="Path to store obtained data")
     parser.add_argument('-p', '--pages', default=300, type=int, help="Max number of pages to process")
+    parser.add_argument('-s', '--store', default=None, help="Path to parquet post store, if passed csv are not written")
+    parser.add_argument('--chunk', default=1000, type=int, help="Number of posts to dump at once")
+    parser.add_argument('--compact', default=None, type=int,
+                        help="Merge part files of store tags having at least this number of them after crawl")
+    parser.add_argument('-i', '--incremental', action="store_true", help="Collect only posts newer than stored ones")
+    parser.add_argument('-d', '--dedup', action="store_true", help="Store every post once for all tags")
+    parser.add_argument('--bloom', default=None, type=int,
+                        help="Expected number of posts, if passed approximate dedup index of fixed size is used")
+    parser.add_argument('--cache', default=None, help="Path to store server responses, cached ones are not requested")
+    parser.add_argument('--cache-ttl', default=None, type=float, help="Seconds to keep cached responses")
+    parser.add_argument('--cache-size', default=None, type=int, help="Max size of cache in bytes")
+    parser.add_argument('--offline', action="store_true", help="Replay cached responses only, requires --cache")
+    parser.add_argument('--metrics-port', default=None, type=int, help="Port to expose prometheus metrics on")
+    parser.add_argument('--metrics-file', default=None, help="Path to dump metrics to after crawl")
     args = parser.parse_args()
 
     # tag_data = get_tag_data(args.tag, max_pages=args.pages)
@@ -221,4 +448,19 @@ if __name__ == '__main__':
 
     tags = pd.read_csv(args.tags, sep=";", header=None)[1].values
 
-    get_all_posts(tags, path=args.path, max_pages=args.pages)
+    store = PostStore(args.store) if args.store else None
+    if args.metrics_port:
+        telemetry.serve(args.metrics_port)
+    if args.cache:
+        use_cache(ResponseCache(args.cache, ttl=args.cache_ttl, max_size=args.cache_size, offline=args.offline))
+    os.makedirs(args.path, exist_ok=True)
+    manifest = CrawlManifest.in_folder(args.path)
+    dedup_index = open_index(args.path, bloom=args.bloom) if args.dedup or args.bloom else None
+    try:
+        get_all_posts(tags, path=args.path, max_pages=args.pages, store=store, manifest=manifest,
+                      chunk_size=args.chunk, incremental=args.incremental, dedup_index=dedup_index)
+    finally:
+        if args.metrics_file:
+            telemetry.dump(args.metrics_file)
+    if store is not None and args.compact:
+        store.compact(min_parts=args.compact)
@@ -0,0 +1,168 @@
+"""
+Columnar storage for crawled posts.
+
+Posts are kept as parquet files partitioned by hash tag in hive layout:
+    <root>/by_tag=<tag>/part-<write time ns>-<uuid>.parquet
+Every append writes a new part file, so crawlers can add data without
+rewriting what is already stored, compact merges part files of a tag into one
+keeping the most recently appended row of every post.
+Reads go through pyarrow.dataset, so tag and date filters skip files and row groups
+instead of being applied after full load.
+"""
+
+
+import os
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+PARTITION_KEY = "by_tag"
+SCHEMA = pa.schema([
+    ("post_id", pa.string()),
+    ("text", pa.string()),
+    ("date", pa.int64()),  # unix timestamp, as in instagram 'taken_at_timestamp'
+    ("likes", pa.int64()),
+    ("owner_id", pa.int64()),
+    ("is_video", pa.bool_()),
+])
+COLUMNS = SCHEMA.names + [PARTITION_KEY]
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive")
+
+
+class PostStore:
+    """
+    Parquet dataset of posts partitioned by 'by_tag' column.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: path to dataset directory, created if missing
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _partition_path(self, tag):
+        return os.path.join(self.root, f"{PARTITION_KEY}={tag}")
+
+    def tags(self):
+        """Returns list of stored hash tags"""
+        prefix = f"{PARTITION_KEY}="
+        return sorted(d[len(prefix):] for d in next(os.walk(self.root))[1] if d.startswith(prefix))
+
+    def append(self, df: "pd.DataFrame", tag=None):
+        """
+        Appends posts to the store, one new part file per tag.
+        :param df: DataFrame with posts, columns as returned by posts_mining.json_to_df
+        :param tag: tag to store posts under, if None 'by_tag' column is used
+        :return: number of written rows
+        """
+        if tag is not None:
+            df = df.assign(**{PARTITION_KEY: tag})
+        elif PARTITION_KEY not in df:
+            raise ValueError(f"DataFrame must contain {PARTITION_KEY} column or tag must be passed")
+
+        written = 0
+        for part_tag, part in df.groupby(PARTITION_KEY, sort=False):
+            table = self._to_table(part)
+            if not table.num_rows:
+                continue
+            path = self._partition_path(part_tag)
+            os.makedirs(path, exist_ok=True)
+            pq.write_table(table, os.path.join(path, _part_name()))
+            written += table.num_rows
+        return written
+
+    def _part_files(self, tag):
+        path = self._partition_path(tag)
+        files = [f for f in next(os.walk(path))[2] if f.startswith("part-") and f.endswith(".parquet")]
+        return [os.path.join(path, f) for f in sorted(files, key=lambda f: (_written_at(f), f))]
+
+    def compact(self, tags=None, min_parts=2):
+        """
+        Merges part files of every tag into one file, of posts stored several times
+        the most recently appended row is kept. New file is written under hidden name and renamed,
+        then old parts are removed, so readers never see partial data.
+        :param tags: iterable of hash tags to compact, if None all tags are compacted
+        :param min_parts: tags with less part files are left as they are
+        :return: number of removed part files
+        """
+        tags = self.tags() if tags is None else [t for t in tags if os.path.isdir(self._partition_path(t))]
+        removed = 0
+        for tag in tags:
+            files = self._part_files(tag)
+            if len(files) < max(min_parts, 2):
+                continue
+            df = pd.concat([pq.read_table(f).to_pandas() for f in files], ignore_index=True, sort=False)
+            df = df.drop_duplicates("post_id", keep="last")
+            name = _part_name()
+            tmp_path = os.path.join(self._partition_path(tag), f".{name}.tmp")  # dot files are not read
+            pq.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False), tmp_path)
+            os.replace(tmp_path, os.path.join(self._partition_path(tag), name))
+            for file_name in files:
+                os.remove(file_name)
+            removed += len(files)
+        return removed
+
+    @staticmethod
+    def _to_table(df):
+        df = df.reindex(columns=SCHEMA.names)
+        df = df.dropna(subset=["post_id"])
+        df = df.assign(
+            post_id=df["post_id"].astype(str),
+            text=df["text"].where(df["text"].notnull(), None),
+            date=pd.to_numeric(df["date"], errors="coerce"),
+            likes=pd.to_numeric(df["likes"], errors="coerce"),
+            owner_id=pd.to_numeric(df["owner_id"], errors="coerce"),
+            is_video=df["is_video"].map({True: True, False: False, "True": True, "False": False}),
+        )
+        return pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+
+    def read(self, columns=None, tags=None, start=None, end=None):
+        """
+        Reads posts into pandas.DataFrame.
+        :param columns: list of columns to load, if None all columns are loaded
+        :param tags: iterable of hash tags to load, if None all tags are loaded
+        :param start: min post timestamp (inclusive), int or anything pandas.Timestamp accepts
+        :param end: max post timestamp (exclusive), int or anything pandas.Timestamp accepts
+        :return: pandas.DataFrame, 'by_tag' column is categorical
+        """
+        columns = list(columns) if columns is not None else list(COLUMNS)
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+
+        tags = self.tags() if tags is None else [t for t in tags if os.path.isdir(self._partition_path(t))]
+        start, end = _to_timestamp(start), _to_timestamp(end)
+
+        condition = ds.field(PARTITION_KEY).isin(pa.array(tags, type=pa.string()))
+        if start is not None:
+            condition &= ds.field("date") >= start
+        if end is not None:
+            condition &= ds.field("date") < end
+        dataset = ds.dataset(self.root, schema=SCHEMA.append(pa.field(PARTITION_KEY, pa.string())),
+                             format="parquet", partitioning=PARTITIONING)
+        df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+        if PARTITION_KEY in df:
+            df[PARTITION_KEY] = pd.Categorical(df[PARTITION_KEY], categories=sorted(set(tags)))
+        return df[columns]
+
+
+def _part_name():
+    return f"part-{time.time_ns():020d}-{uuid.uuid4().hex}.parquet"
+
+
+def _written_at(file_name):
+    """Returns write time of part file in ns, 0 for parts named without it (older than any named with it)"""
+    stamp = file_name[len("part-"):].split("-")[0]
+    return int(stamp) if "-" in file_name[len("part-"):] and stamp.isdigit() else 0
+
+
+def _to_timestamp(value):
+    if value is None or isinstance(value, int):
+        return value
+    return int(pd.Timestamp(value).timestamp())
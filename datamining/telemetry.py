@@ -0,0 +1,65 @@
+"""
+Crawler metrics: request counts and latencies, retries, time spent sleeping,
+pages, posts and likes collected, dump latencies.
+Metrics could be exposed via http for prometheus (serve) or dumped to text file (dump).
+"""
+
+
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server, write_to_textfile
+
+
+REGISTRY = CollectorRegistry()
+
+REQUESTS = Counter("crawler_requests_total", "Requests by endpoint and result",
+                   ["endpoint", "result"], registry=REGISTRY)
+REQUEST_SECONDS = Histogram("crawler_request_seconds", "Request latency", ["endpoint"], registry=REGISTRY,
+                            buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+RETRIES = Counter("crawler_retries_total", "Retried requests", ["endpoint"], registry=REGISTRY)
+SLEEP_SECONDS = Counter("crawler_sleep_seconds_total", "Time spent sleeping", ["reason"], registry=REGISTRY)
+PAGES = Counter("crawler_pages_total", "Hash tag pages fetched", registry=REGISTRY)
+POSTS = Counter("crawler_posts_total", "Posts parsed from pages", registry=REGISTRY)
+LIKES = Counter("crawler_likes_total", "Likes collected", registry=REGISTRY)
+WRITE_SECONDS = Histogram("crawler_write_seconds", "Dump latency", ["sink"], registry=REGISTRY)
+ROWS_WRITTEN = Counter("crawler_rows_written_total", "Dumped rows", ["sink"], registry=REGISTRY)
+
+
+@contextmanager
+def request(endpoint):
+    """Measures request latency, counts it as 'ok' or as error class name if exception is raised"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        REQUESTS.labels(endpoint, type(e).__name__).inc()
+        raise
+    else:
+        REQUESTS.labels(endpoint, "ok").inc()
+    finally:
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def write(sink, rows):
+    """Measures dump latency"""
+    with WRITE_SECONDS.labels(sink).time():
+        yield
+    ROWS_WRITTEN.labels(sink).inc(rows)
+
+
+def sleep(seconds, reason):
+    """time.sleep which is counted in crawler_sleep_seconds_total"""
+    SLEEP_SECONDS.labels(reason).inc(seconds)
+    time.sleep(seconds)
+
+
+def serve(port):
+    """Exposes metrics on http://localhost:port/ in background thread"""
+    start_http_server(port, registry=REGISTRY)
+
+
+def dump(path):
+    """Writes metrics to text file in prometheus format"""
+    write_to_textfile(path, REGISTRY)
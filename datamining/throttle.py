@@ -0,0 +1,82 @@
+"""
+Rate limiting shared between crawler workers.
+"""
+
+
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    Global token bucket: allows 'rate' requests per second on average
+    with bursts up to 'capacity' requests. Safe to share between threads
+    and between coroutines of one event loop.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        :param rate: float, tokens added per second
+        :param capacity: int, max number of tokens bucket can hold
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes one token, returns number of seconds to wait until it is actually available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return max(0., -self._tokens / self.rate)
+
+    def acquire(self):
+        """Blocks current thread until token is available"""
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """Suspends current coroutine until token is available"""
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class AIMDLimiter(TokenBucket):
+    """
+    Token bucket with adaptive rate: additive increase after every successful request,
+    multiplicative decrease after every error, so shared rate converges to what server tolerates.
+    """
+
+    def __init__(self, rate, max_rate=None, min_rate=0.05, increase=0.05, decrease=0.5, capacity=1):
+        """
+        :param rate: float, initial requests per second
+        :param max_rate: float, rate is never increased above it, if None initial rate is used
+        :param min_rate: float, rate is never decreased below it
+        :param increase: float, requests per second added after success
+        :param decrease: float, rate multiplier after error
+        :param capacity: int, max number of requests allowed to be sent at once
+        """
+        super().__init__(rate, capacity)
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+
+    def success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def failure(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
@@ -0,0 +1,194 @@
+"""
+Nearest neighbours indexes of sparse TF-IDF vectors with cosine distance.
+
+BruteForceIndex scans all posts, as NearestNeighbors(metric='cosine', algorithm='brute').
+LSHIndex hashes posts with signed random projections in several tables, so only posts
+sharing a bucket with the query are scored. More tables and probes give higher recall
+and higher latency, more bits per table give smaller buckets and lower latency.
+Both indexes have kneighbors method with NearestNeighbors-like output.
+Posts could be added with partial_fit and removed without refitting, features
+unknown at fit (e.g. words new to growing vocabulary) are supported.
+"""
+
+
+import numpy as np
+import scipy.sparse as sp
+
+from recommender.topk import normalize, resize_columns, top_k_similar
+
+
+def _top_k(similarities, candidates, k):
+    """Returns (distances, indices) of k most similar candidates sorted by distance"""
+    if len(candidates) > k:
+        part = np.argpartition(-similarities, k - 1)[:k]
+        similarities, candidates = similarities[part], candidates[part]
+    order = np.argsort(-similarities, kind="stable")
+    return 1 - similarities[order], candidates[order]
+
+
+class BruteForceIndex:
+    """
+    Exact index, every query is compared with every post.
+    """
+
+    def fit(self, X):
+        """
+        :param X: sparse matrix, one row per post
+        :return: self
+        """
+        self._X = normalize(X)
+        self._valid = np.ones(self._X.shape[0], dtype=bool)
+        return self
+
+    def partial_fit(self, X):
+        """
+        Adds posts, their ids continue ids of already indexed posts
+        :param X: sparse matrix, one row per post
+        :return: self
+        """
+        if not hasattr(self, "_X"):
+            return self.fit(X)
+        X = normalize(X)
+        n_features = max(X.shape[1], self._X.shape[1])
+        self._X = sp.vstack([resize_columns(self._X, n_features), resize_columns(X, n_features)], format="csr")
+        self._valid = np.concatenate([self._valid, np.ones(X.shape[0], dtype=bool)])
+        return self
+
+    def remove(self, ids):
+        """Excludes posts from results, their ids are not reused"""
+        self._valid[ids] = False
+        return self
+
+    def kneighbors(self, Q, n_neighbors=5, n_jobs=1):
+        """
+        :param Q: sparse matrix of queries
+        :param n_neighbors: number of neighbours
+        :param n_jobs: number of threads to process blocks of queries, see recommender.topk
+        :return: (distances, indices) arrays of shape (n_queries, n_neighbors),
+        rows are padded with inf distance and -1 index if index has less posts
+        """
+        valid = None if self._valid.all() else self._valid
+        return top_k_similar(normalize(Q), self._X, n_neighbors, n_jobs=n_jobs, normalized=True, valid=valid)
+
+
+class LSHIndex:
+    """
+    Random projection LSH for cosine similarity with multi-probe queries.
+    Found candidates are ranked by exact cosine similarity.
+    """
+
+    def __init__(self, n_tables=16, n_bits=8, n_probes=2, seed=0):
+        """
+        :param n_tables: number of hash tables, post is candidate if it shares bucket with query in any table
+        :param n_bits: number of projections per table, bucket key is vector of projection signs
+        :param n_probes: number of extra buckets looked up per table, buckets differing from query bucket
+        in the signs of projections closest to zero go first
+        :param seed: random seed of projections
+        """
+        if n_bits > 62:
+            raise ValueError("n_bits must be at most 62")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_probes = n_probes
+        self.seed = seed
+
+    def fit(self, X):
+        """
+        :param X: sparse matrix, one row per post
+        :return: self
+        """
+        self._X = normalize(X)
+        self._valid = np.ones(self._X.shape[0], dtype=bool)
+        self._rng = np.random.RandomState(self.seed)
+        self._projections = np.empty((0, self.n_tables * self.n_bits), dtype=np.float32)
+        self._weights = np.left_shift(1, np.arange(self.n_bits, dtype=np.int64))
+
+        codes = self._codes(self._project(self._X) > 0)
+        self._order = np.argsort(codes, axis=0, kind="stable")
+        self._sorted = np.take_along_axis(codes, self._order, axis=0)
+        return self
+
+    def partial_fit(self, X):
+        """
+        Adds posts, their ids continue ids of already indexed posts
+        :param X: sparse matrix, one row per post
+        :return: self
+        """
+        if not hasattr(self, "_X"):
+            return self.fit(X)
+        X = normalize(X)
+        codes = self._codes(self._project(X) > 0)
+        ids = np.arange(self._X.shape[0], self._X.shape[0] + X.shape[0])
+
+        order, sorted_codes = [], []
+        for t in range(self.n_tables):
+            new = np.argsort(codes[:, t], kind="stable")
+            positions = np.searchsorted(self._sorted[:, t], codes[new, t], side="right")
+            order.append(np.insert(self._order[:, t], positions, ids[new]))
+            sorted_codes.append(np.insert(self._sorted[:, t], positions, codes[new, t]))
+        self._order, self._sorted = np.column_stack(order), np.column_stack(sorted_codes)
+
+        n_features = max(X.shape[1], self._X.shape[1])
+        self._X = sp.vstack([resize_columns(self._X, n_features), resize_columns(X, n_features)], format="csr")
+        self._valid = np.concatenate([self._valid, np.ones(X.shape[0], dtype=bool)])
+        return self
+
+    def remove(self, ids):
+        """Excludes posts from results, their ids are not reused"""
+        self._valid[ids] = False
+        return self
+
+    def _project(self, X):
+        # dense, since posts are short and sparse projections would give zeros for most of them,
+        # rows of new features are drawn when they first appear, so old projections never change
+        if X.shape[1] > self._projections.shape[0]:
+            extra = self._rng.standard_normal((X.shape[1] - self._projections.shape[0], self._projections.shape[1]))
+            self._projections = np.vstack([self._projections, extra.astype(np.float32)])
+        X = resize_columns(X, self._projections.shape[0])
+        return np.asarray(X @ self._projections).reshape(X.shape[0], self.n_tables, self.n_bits)
+
+    def _codes(self, signs):
+        """Returns array of shape (n, n_tables) with bucket keys"""
+        return signs.astype(np.int64) @ self._weights
+
+    def _probe_codes(self, projection):
+        """Returns array of shape (1 + n_probes, n_tables) with bucket keys to look up for one query"""
+        code = self._codes(projection > 0)
+        flips = np.argsort(np.abs(projection), axis=1)[:, :self.n_probes]  # least confident bits
+        return np.vstack([code[None, :], code[None, :] ^ self._weights[flips].T])
+
+    def candidates(self, projection):
+        """Returns array of posts sharing any probed bucket with query"""
+        found = []
+        for codes in self._probe_codes(projection):
+            for t, code in enumerate(codes):
+                start = np.searchsorted(self._sorted[:, t], code, side="left")
+                stop = np.searchsorted(self._sorted[:, t], code, side="right")
+                found.append(self._order[start:stop, t])
+        found = np.unique(np.concatenate(found))
+        return found[self._valid[found]]
+
+    def kneighbors(self, Q, n_neighbors=5):
+        """
+        :param Q: sparse matrix of queries
+        :param n_neighbors: number of neighbours
+        :return: (distances, indices) arrays of shape (n_queries, n_neighbors),
+        rows are padded with inf distance and -1 index if less candidates are found
+        """
+        Q = normalize(Q)
+        projections = self._project(Q)
+        res = []
+        for i in range(Q.shape[0]):
+            candidates = self.candidates(projections[i])
+            similarities = (self._X[candidates] @ resize_columns(Q[i], self._X.shape[1]).T).toarray().ravel()
+            res.append(_top_k(similarities, candidates, n_neighbors))
+        return _stack(res, n_neighbors)
+
+
+def _stack(results, k):
+    distances = np.full((len(results), k), np.inf)
+    indices = np.full((len(results), k), -1, dtype=np.int64)
+    for i, (dist, ind) in enumerate(results):
+        distances[i, :len(dist)] = dist
+        indices[i, :len(ind)] = ind
+    return distances, indices
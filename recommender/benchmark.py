@@ -0,0 +1,56 @@
+"""
+Recall and latency of approximate indexes against brute-force baseline.
+
+    from recommender.ann import LSHIndex
+    from recommender.benchmark import benchmark
+    benchmark(train_data, {"lsh": LSHIndex(), "lsh_probes": LSHIndex(n_probes=4)}, k=5)
+"""
+
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommender.ann import BruteForceIndex
+
+
+def recall_at_k(true_indices, found_indices):
+    """
+    :param true_indices: array (n_queries, k) of exact neighbours
+    :param found_indices: array (n_queries, k) of approximate neighbours
+    :return: mean share of exact neighbours found
+    """
+    hits = [len(np.intersect1d(t[t >= 0], f[f >= 0])) / max((t >= 0).sum(), 1)
+            for t, f in zip(true_indices, found_indices)]
+    return float(np.mean(hits))
+
+
+def benchmark(X, indexes, n_queries=100, k=10, seed=0):
+    """
+    Fits every index on X and queries it with random rows of X
+    :param X: sparse matrix, one row per post
+    :param indexes: dict name -> not fitted index
+    :param n_queries: number of queries
+    :param k: number of neighbours
+    :param seed: random seed of queries choice
+    :return: pd.DataFrame with fit_seconds, query_ms (mean per query) and recall@k columns, one row per index
+    """
+    queries = X[np.random.RandomState(seed).choice(X.shape[0], min(n_queries, X.shape[0]), replace=False)]
+    rows = {}
+    true_indices = None
+    for name, index in [("brute", BruteForceIndex())] + list(indexes.items()):
+        start = time.perf_counter()
+        index.fit(X)
+        fit_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # one query at a time, as in interactive recommendations
+        indices = np.vstack([index.kneighbors(queries[i], n_neighbors=k)[1] for i in range(queries.shape[0])])
+        query_ms = (time.perf_counter() - start) * 1000 / queries.shape[0]
+
+        if true_indices is None:
+            true_indices = indices
+        rows[name] = {"fit_seconds": fit_seconds, "query_ms": query_ms,
+                      f"recall@{k}": recall_at_k(true_indices, indices)}
+    return pd.DataFrame.from_dict(rows, orient="index")
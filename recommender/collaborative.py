@@ -0,0 +1,153 @@
+"""
+Item-item collaborative filtering on likes and its blend with content recommendations.
+
+Posts are rows of sparse post x user likes matrix (see datamining.likes_store),
+similarity of two posts is cosine of their like vectors, i.e. number of common
+likers divided by sqrt of product of like counts. Top neighbours of every post
+are found with blocked products (recommender.topk), so dense post x post matrix
+is never built.
+"""
+
+
+import numpy as np
+
+from datamining.likes_store import load_likes
+from recommender.topk import all_pairs_top_k
+
+
+class ItemItemCF:
+    """
+    Precomputed table of most similar posts by likes.
+    """
+
+    def __init__(self, n_neighbors=50, min_likes=2, shrinkage=0., **top_k_params):
+        """
+        :param n_neighbors: number of neighbours kept per post
+        :param min_likes: users with less likes are dropped, they add no co-occurrences
+        :param shrinkage: similarity is multiplied by common / (common + shrinkage),
+        so pairs with few common likers are trusted less
+        :param top_k_params: block_size, n_jobs, max_block_bytes of recommender.topk.top_k_similar
+        """
+        self.n_neighbors = n_neighbors
+        self.min_likes = min_likes
+        self.shrinkage = shrinkage
+        self.top_k_params = top_k_params
+
+    @classmethod
+    def from_likes(cls, path, **params):
+        """
+        :param path: folder with likes shards, see datamining.likes_store
+        :param params: see __init__
+        :return: fitted ItemItemCF
+        """
+        likes, posts, _ = load_likes(path)
+        return cls(**params).fit(likes, posts.items())
+
+    def fit(self, likes, post_ids):
+        """
+        :param likes: sparse matrix post x user, nonzero for every like
+        :param post_ids: list of post ids of likes rows
+        :return: self
+        """
+        likes = likes.tocsc()
+        users = np.flatnonzero(np.diff(likes.indptr) >= self.min_likes)
+        likes = likes[:, users].tocsr()
+        likes.data[:] = 1
+
+        self.post_ids = list(post_ids)
+        self._rows = {p: i for i, p in enumerate(self.post_ids)}
+        self.n_likes = np.diff(likes.indptr)
+
+        distances, indices = all_pairs_top_k(likes, self.n_neighbors, **self.top_k_params)
+        similarities = 1 - distances
+        if self.shrinkage:
+            norms = np.sqrt(self.n_likes[:, None] * self.n_likes[np.maximum(indices, 0)])
+            common = similarities * norms
+            similarities = similarities * common / (common + self.shrinkage)
+            order = np.argsort(-similarities, axis=1, kind="stable")
+            similarities = np.take_along_axis(similarities, order, axis=1)
+            indices = np.take_along_axis(indices, order, axis=1)
+        similarities[(indices < 0) | ~(similarities > 0)] = 0  # posts without common likers are not similar
+        self.similarities = similarities
+        self.indices = indices
+        return self
+
+    def __contains__(self, post_id):
+        return post_id in self._rows
+
+    def similar_posts(self, post_ids, n_neighbors=5):
+        """
+        :param post_ids: list of post ids, unknown or not liked posts get no recommendations
+        :param n_neighbors: number of recommendations, at most n_neighbors of __init__
+        :return: (distances array, list of lists of post ids), same as IncrementalRecommender.similar_posts
+        """
+        distances = np.full((len(post_ids), n_neighbors), np.inf)
+        res = []
+        for i, post_id in enumerate(post_ids):
+            row = self._rows.get(post_id)
+            if row is None:
+                res.append([])
+                continue
+            found = self.similarities[row] > 0
+            sims, ids = self.similarities[row][found][:n_neighbors], self.indices[row][found][:n_neighbors]
+            distances[i, :len(sims)] = 1 - sims
+            res.append([self.post_ids[j] for j in ids])
+        return distances, res
+
+
+class HybridRecommender:
+    """
+    Blends content and collaborative neighbours: score = alpha * content similarity
+    + (1 - alpha) * likes similarity, post missing in one of the models gets score of the other one,
+    so posts without text signal are still recommended by likes and vice versa.
+    Content model is the catalogue of live posts: posts unknown to it (e.g. expired ones,
+    which are still in likes table) are never recommended.
+    """
+
+    def __init__(self, content, collaborative, alpha=0.5, candidates=3):
+        """
+        :param content: recommender with similar_posts and __contains__, e.g. IncrementalRecommender,
+        if None posts are recommended by likes only and are not filtered
+        :param collaborative: ItemItemCF
+        :param alpha: weight of content similarity
+        :param candidates: each model is asked for candidates * n_neighbors posts
+        """
+        self.content = content
+        self.collaborative = collaborative
+        self.alpha = alpha
+        self.candidates = candidates
+
+    def _neighbours(self, model, post_id, n):
+        if model is None or post_id not in model:
+            return None
+        distances, ids = model.similar_posts([post_id], n)
+        return {p: 1 - d for p, d in zip(ids[0], distances[0])}
+
+    def similar_posts(self, post_ids, n_neighbors=5):
+        """
+        :param post_ids: list of post ids known to any of the models
+        :param n_neighbors: number of recommendations
+        :return: (distances array, list of lists of post ids), distance is 1 - blended score
+        """
+        n = n_neighbors * self.candidates
+        distances = np.full((len(post_ids), n_neighbors), np.inf)
+        res = []
+        for i, post_id in enumerate(post_ids):
+            content = self._neighbours(self.content, post_id, n)
+            likes = self._neighbours(self.collaborative, post_id, n)
+            if self.content is not None and likes:
+                likes = {p: s for p, s in likes.items() if p in self.content}
+            if content is not None and not any(s > 0 for s in content.values()):
+                content = None  # e.g. post without known words
+            if content is None or likes is None or not likes:
+                alpha = 0. if content is None else 1.
+            else:
+                alpha = self.alpha
+            scores = {}
+            for weight, sims in ((alpha, content), (1 - alpha, likes)):
+                for p, s in (sims or {}).items():
+                    scores[p] = scores.get(p, 0.) + weight * s
+            best = sorted(scores.items(), key=lambda item: -item[1])[:n_neighbors]
+            distances[i, :len(best)] = [1 - s for _, s in best]
+            res.append([p for p, _ in best])
+        return distances, res
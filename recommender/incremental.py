@@ -0,0 +1,189 @@
+"""
+Content recommender updated with new and expired posts without full refit.
+
+Document frequencies are kept as counts and updated on every add and remove.
+Indexed vectors are weighted with idf snapshot taken at last refit (new words get
+idf of the moment they first appear), so index rows never change between refits.
+When weighted difference between current and snapshot idf exceeds drift threshold,
+all vectors are re-weighted and index is rebuilt without removed posts.
+"""
+
+
+import numpy as np
+import scipy.sparse as sp
+
+from recommender.ann import LSHIndex
+from recommender.topk import resize_columns
+from utils.tfidf import counts_matrix
+from utils.vocabulary import Vocabulary
+
+
+class IncrementalRecommender:
+    """
+    TF-IDF model of posts with incremental document frequencies and index updates.
+    """
+
+    def __init__(self, index=None, drift_threshold=0.1, smooth_idf=True, sublinear_tf=False, vocabulary=None):
+        """
+        :param index: not fitted LSHIndex or BruteForceIndex, LSHIndex() if None
+        :param drift_threshold: relative idf drift which triggers full re-weighting, see drift
+        :param smooth_idf: add one to document frequencies, as sklearn TfidfVectorizer
+        :param sublinear_tf: replace tf with 1 + log(tf)
+        :param vocabulary: utils.vocabulary.Vocabulary of tokens, could be shared with TextProcessing
+        """
+        self.index = index if index is not None else LSHIndex()
+        self.drift_threshold = drift_threshold
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+
+        self._rows = {}  # post id -> index row
+        self._post_ids = []  # index row -> post id
+        self._blocks = []  # token counts of index rows, stacked on demand
+        self._alive = np.zeros(0, dtype=bool)
+        self._df = np.zeros(0, dtype=np.int64)
+        self._idf = np.zeros(0)  # snapshot used to weight indexed vectors
+        self.n_refits = 0
+
+    def __len__(self):
+        """Number of not removed posts"""
+        return len(self._rows)
+
+    def __contains__(self, post_id):
+        return post_id in self._rows
+
+    def _current_idf(self):
+        smooth = int(self.smooth_idf)
+        return np.log((len(self) + smooth) / (self._df + smooth)) + 1
+
+    def drift(self):
+        """
+        Returns sum(df * |idf - snapshot idf|) / sum(df * snapshot idf) over all words,
+        i.e. relative change of weights of an average post since last refit
+        """
+        if not len(self):
+            return 0.
+        total = (self._df * self._idf).sum()
+        return float((self._df * np.abs(self._current_idf() - self._idf)).sum() / total) if total else 0.
+
+    def _counts(self):
+        """Returns csr_matrix of token counts of all index rows, removed ones included"""
+        n_features = len(self.vocabulary)
+        if len(self._blocks) != 1 or self._blocks[0].shape[1] != n_features:
+            blocks = [resize_columns(b, n_features) for b in self._blocks]
+            self._blocks = [sp.vstack(blocks, format="csr") if blocks else sp.csr_matrix((0, n_features))]
+        return self._blocks[0]
+
+    def _weight(self, counts, idf):
+        counts = resize_columns(counts, len(idf)).astype(np.float64)
+        if self.sublinear_tf:
+            counts.data = np.log(counts.data) + 1
+        return counts @ sp.diags(idf)
+
+    def _grow(self):
+        """Extends df and idf snapshot to new words of vocabulary"""
+        n_new = len(self.vocabulary) - len(self._df)
+        if n_new > 0:
+            self._df = np.concatenate([self._df, np.zeros(n_new, dtype=np.int64)])
+            self._idf = np.concatenate([self._idf, np.zeros(n_new)])
+            return n_new
+        return 0
+
+    def add(self, post_ids, docs):
+        """
+        Adds new posts or replaces posts with the same ids
+        :param post_ids: list of post ids, e.g. shortcodes, of repeated ids the last one is added
+        :param docs: list of token lists, e.g. result of TextProcessing.transform
+        :return: self
+        """
+        post_ids, docs = list(post_ids), list(docs)
+        last = {p: i for i, p in enumerate(post_ids)}
+        if len(last) < len(post_ids):  # e.g. post found by several tags
+            keep = sorted(last.values())
+            post_ids, docs = [post_ids[i] for i in keep], [docs[i] for i in keep]
+        self.remove([p for p in post_ids if p in self._rows], refit=False)
+        counts = counts_matrix(self.vocabulary.encode(docs), len(self.vocabulary))
+
+        n_new = self._grow()
+        self._df += np.bincount(counts.indices, minlength=len(self._df))
+        start = len(self._post_ids)
+        for i, post_id in enumerate(post_ids):
+            self._rows[post_id] = start + i
+        self._post_ids.extend(post_ids)
+        self._alive = np.concatenate([self._alive, np.ones(len(post_ids), dtype=bool)])
+        self._blocks.append(counts)
+
+        if n_new:
+            self._idf[-n_new:] = self._current_idf()[-n_new:]
+        if self.n_refits == 0 or self.drift() > self.drift_threshold:
+            return self.refit()
+        self.index.partial_fit(self._weight(counts, self._idf))
+        return self
+
+    def remove(self, post_ids, refit=True):
+        """
+        Retires posts, e.g. expired workshops, unknown ids are ignored
+        :param post_ids: list of post ids
+        :param refit: if True model is refitted when drift exceeds threshold
+        :return: self
+        """
+        rows = [self._rows.pop(p) for p in post_ids if p in self._rows]
+        if not rows:
+            return self
+        counts = self._counts()[rows]
+        self._df -= np.bincount(counts.indices, minlength=len(self._df))
+        self._alive[rows] = False
+        self.index.remove(rows)
+        if refit and self.drift() > self.drift_threshold:
+            return self.refit()
+        return self
+
+    def refit(self):
+        """
+        Re-weights all posts with current idf and rebuilds index, removed posts are dropped
+        :return: self
+        """
+        self._grow()
+        counts = self._counts()[np.flatnonzero(self._alive)]
+        self._post_ids = [p for p, alive in zip(self._post_ids, self._alive) if alive]
+        self._rows = {p: i for i, p in enumerate(self._post_ids)}
+        self._alive = np.ones(len(self._post_ids), dtype=bool)
+        self._blocks = [counts]
+        self._idf = self._current_idf()
+        self.index.fit(self._weight(counts, self._idf))
+        self.n_refits += 1
+        return self
+
+    def query(self, docs, n_neighbors=5):
+        """
+        Recommends posts for new documents, which are not added to the model
+        :param docs: list of token lists
+        :param n_neighbors: number of recommendations
+        :return: (distances array, list of lists of post ids), posts without common words
+        with the document are not recommended
+        """
+        # words unknown to the model are dropped, so queries do not grow vocabulary
+        known = [[w for w in doc if w in self.vocabulary] for doc in docs]
+        counts = counts_matrix(self.vocabulary.encode(known), len(self._idf))
+        distances, rows = self.index.kneighbors(self._weight(counts, self._idf), n_neighbors)
+        related = distances < 1  # zero vectors are at distance 1 from every post
+        distances[~related] = np.inf
+        return distances, [[self._post_ids[r] for r in row[keep]] for row, keep in zip(rows, related)]
+
+    def similar_posts(self, post_ids, n_neighbors=5):
+        """
+        :param post_ids: list of post ids added to the model
+        :param n_neighbors: number of recommendations, post itself is excluded
+        :return: (distances array, list of lists of post ids), posts without common words are not recommended
+        """
+        rows = [self._rows[p] for p in post_ids]
+        vectors = self._weight(self._counts()[rows], self._idf)
+        distances, found = self.index.kneighbors(vectors, n_neighbors + 1)
+
+        res_distances = np.full((len(rows), n_neighbors), np.inf)
+        res_ids = []
+        for i, row in enumerate(rows):
+            keep = (found[i] >= 0) & (found[i] != row) & (distances[i] < 1)
+            res_distances[i, :min(keep.sum(), n_neighbors)] = distances[i][keep][:n_neighbors]
+            res_ids.append([self._post_ids[r] for r in found[i][keep][:n_neighbors]])
+        return res_distances, res_ids
@@ -0,0 +1,126 @@
+"""
+Batched exact top-k cosine neighbours.
+
+Queries are split in blocks, every block is multiplied by the whole post matrix,
+top k of each row are picked with argpartition and the dense block is dropped.
+Every block holds block_size * n_posts similarities and as many argpartition indices
+(16 bytes per pair), so memory is bounded by n_jobs * max_block_bytes. Blocks run in threads,
+sparse products and numpy selection release the GIL for most of their work.
+"""
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def normalize(X):
+    """Returns csr_matrix with l2 normalized rows, zero rows are left zero"""
+    X = sp.csr_matrix(X, dtype=np.float64)
+    X.sum_duplicates()
+    norms = np.sqrt(X.multiply(X).sum(axis=1).A1)
+    norms[norms == 0] = 1
+    return sp.diags(1 / norms) @ X
+
+
+def resize_columns(X, n_features):
+    """Returns csr_matrix X with n_features columns, added columns are zero, extra columns are dropped"""
+    X = sp.csr_matrix(X)
+    if X.shape[1] > n_features:
+        X = X[:, :n_features]
+    elif X.shape[1] < n_features:
+        X = sp.csr_matrix((X.data, X.indices, X.indptr), shape=(X.shape[0], n_features))
+    return X
+
+
+def block_top_k(similarities, k, offset=None, valid=None):
+    """
+    :param similarities: dense array (n_queries, n_posts), overwritten
+    :param k: number of neighbours
+    :param offset: if not None, query i is post offset + i and is excluded from its neighbours
+    :param valid: boolean array of posts which could be returned, all posts if None
+    :return: (distances, indices) arrays (n_queries, k) sorted by distance,
+    padded with inf distance and -1 index if there are less than k posts
+    """
+    n_queries, n_posts = similarities.shape
+    negated = np.negative(similarities, out=similarities)  # in place, -similarities would copy the block
+    if valid is not None:
+        negated[:, ~valid] = np.inf
+    if offset is not None:
+        rows = np.arange(n_queries)
+        cols = offset + rows
+        inside = cols < n_posts
+        negated[rows[inside], cols[inside]] = np.inf
+
+    kk = min(k, n_posts)
+    if kk < n_posts:
+        indices = np.argpartition(negated, kk - 1, axis=1)[:, :kk]
+    else:
+        indices = np.tile(np.arange(n_posts), (n_queries, 1))
+    top = np.take_along_axis(negated, indices, axis=1)
+    order = np.argsort(top, axis=1, kind="stable")
+    indices = np.take_along_axis(indices, order, axis=1)
+    distances = 1 + np.take_along_axis(top, order, axis=1)
+
+    excluded = np.isinf(distances)
+    indices[excluded] = -1
+    if kk < k:
+        distances = np.hstack([distances, np.full((n_queries, k - kk), np.inf)])
+        indices = np.hstack([indices, np.full((n_queries, k - kk), -1, dtype=indices.dtype)])
+    return distances, indices
+
+
+def top_k_similar(Q, X, k=5, block_size=None, n_jobs=1, max_block_bytes=2 ** 27, exclude_self=False,
+                  normalized=False, valid=None):
+    """
+    Finds k most cosine similar rows of X for every row of Q
+    :param Q: sparse matrix of queries
+    :param X: sparse matrix of posts
+    :param k: number of neighbours
+    :param block_size: number of queries per block, chosen by max_block_bytes if None
+    :param n_jobs: number of threads, -1 means all cores
+    :param max_block_bytes: memory limit for dense similarities and argpartition indices of one block
+    :param exclude_self: if True Q is X (or its first rows) and post is not returned as its own neighbour
+    :param normalized: if True rows of Q and X are already l2 normalized
+    :param valid: boolean array of rows of X which could be returned, e.g. not removed posts, all if None
+    :return: (distances, indices) arrays of shape (n_queries, k)
+    """
+    if not normalized:
+        Q, X = normalize(Q), normalize(X)
+    if Q.shape[1] != X.shape[1]:  # vocabulary grew after one of them was built
+        n_features = max(Q.shape[1], X.shape[1])
+        Q, X = resize_columns(Q, n_features), resize_columns(X, n_features)
+    XT = X.T.tocsr()
+    n_queries, n_posts = Q.shape[0], X.shape[0]
+    if block_size is None:
+        # float64 similarity and int64 argpartition index per pair
+        block_size = max(1, max_block_bytes // (16 * max(n_posts, 1)))
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    def run(start):
+        similarities = (Q[start:start + block_size] @ XT).toarray()
+        return block_top_k(similarities, k, start if exclude_self else None, valid)
+
+    starts = range(0, n_queries, block_size)
+    if n_jobs == 1:
+        blocks = [run(start) for start in starts]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            blocks = list(pool.map(run, starts))  # keeps blocks order
+
+    if not blocks:
+        return np.empty((0, k)), np.empty((0, k), dtype=np.int64)
+    return np.vstack([b[0] for b in blocks]), np.vstack([b[1] for b in blocks])
+
+
+def all_pairs_top_k(X, k=5, **kwargs):
+    """
+    Top k similar posts for every post, post itself excluded
+    :param X: sparse matrix of posts
+    :param kwargs: see top_k_similar
+    :return: (distances, indices) arrays of shape (n_posts, k)
+    """
+    return top_k_similar(X, X, k, exclude_self=True, **kwargs)
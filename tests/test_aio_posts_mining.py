@@ -0,0 +1,117 @@
+import os
+import asyncio
+
+import pandas as pd
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from datamining import aio_posts_mining
+from datamining.aio_posts_mining import crawl_tags
+from datamining.manifest import CrawlManifest
+
+
+PAGE_SIZE = 3
+N_PAGES = 4
+
+
+def make_page(tag, page_n):
+    """Page json in instagram format, cursor of page n is 'c<n>'"""
+    edges = [{"node": {
+        "shortcode": f"{tag}{page_n}_{i}",
+        "edge_media_to_caption": {"edges": [{"node": {"text": f"post {i} of page {page_n}"}}]},
+        "taken_at_timestamp": 1000 - page_n * PAGE_SIZE - i,
+        "edge_liked_by": {"count": i},
+        "owner": {"id": i},
+        "is_video": False,
+    }} for i in range(PAGE_SIZE)]
+    page_info = {"has_next_page": page_n < N_PAGES, "end_cursor": f"c{page_n}"}
+    return {"graphql": {"hashtag": {"edge_hashtag_to_media": {"page_info": page_info, "edges": edges}}}}
+
+
+class StubInstagram:
+    """Serves N_PAGES pages per tag, answers 429 to the first requests of pages listed in throttled"""
+
+    def __init__(self, throttled=(), retry_after="0"):
+        self.throttled = dict.fromkeys(throttled, 1)
+        self.retry_after = retry_after
+        self.requests = []
+
+    async def handle(self, request):
+        tag, cursor = request.match_info["tag"], request.query.get("max_id")
+        assert request.query["__a"] == "1"
+        self.requests.append((tag, cursor))
+        page_n = int(cursor[1:]) + 1 if cursor else 1
+        if self.throttled.get(page_n):
+            self.throttled[page_n] -= 1
+            return web.json_response({"message": "Please wait a few minutes"}, status=429,
+                                     headers={"Retry-After": self.retry_after})
+        return web.json_response(make_page(tag, page_n))
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/explore/tags/{tag}/", self.handle)
+        return app
+
+
+async def crawl(stub, tmp_path, tags, **kwargs):
+    server = TestServer(stub.app())
+    await server.start_server()
+    try:
+        await crawl_tags(tags, str(tmp_path), rate=1000., burst=10, base_url=str(server.make_url("/")),
+                         **kwargs)
+    finally:
+        await server.close()
+
+
+def read_posts(path, tag, index=0):
+    return pd.read_csv(os.path.join(path, f"{tag}_{index}.csv"), sep=";")
+
+
+@pytest.mark.asyncio
+async def test_crawl_follows_pagination(tmp_path):
+    stub = StubInstagram()
+    await crawl(stub, tmp_path, ["cats", "dogs"], chunk_size=4)
+
+    for index, tag in enumerate(["cats", "dogs"]):
+        requests = [cursor for t, cursor in stub.requests if t == tag]
+        assert requests == [None, "c1", "c2", "c3"]
+        df = read_posts(tmp_path, tag, index)
+        assert sorted(df.post_id) == sorted(f"{tag}{p}_{i}" for p in range(1, N_PAGES + 1) for i in range(PAGE_SIZE))
+        assert (df.by_tag == tag).all()
+
+
+@pytest.mark.asyncio
+async def test_crawl_backs_off_on_429(tmp_path, monkeypatch):
+    sleeps = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        sleeps.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(aio_posts_mining.asyncio, "sleep", fake_sleep)
+    stub = StubInstagram(throttled=[2], retry_after="7")
+    await crawl(stub, tmp_path, ["cats"])
+
+    assert [cursor for _, cursor in stub.requests] == [None, "c1", "c1", "c2", "c3"]
+    assert 7 in sleeps
+    assert len(read_posts(tmp_path, "cats")) == N_PAGES * PAGE_SIZE
+
+
+@pytest.mark.asyncio
+async def test_crawl_resumes_from_manifest_cursor(tmp_path):
+    manifest = CrawlManifest.in_folder(str(tmp_path))
+    manifest.set_cursor("cats", "c2", 2)
+    manifest.save()
+
+    stub = StubInstagram()
+    manifest = CrawlManifest.in_folder(str(tmp_path))
+    await crawl(stub, tmp_path, ["cats"], manifest=manifest, max_pages=10)
+
+    assert [cursor for _, cursor in stub.requests] == ["c2", "c3"]
+    df = read_posts(tmp_path, "cats")
+    assert sorted(df.post_id) == sorted(f"cats{p}_{i}" for p in (3, 4) for i in range(PAGE_SIZE))
+    manifest = CrawlManifest.in_folder(str(tmp_path))
+    assert "cats" in manifest.tags
+    assert manifest.cursor("cats") == (None, 0)
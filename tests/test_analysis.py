@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+
+from utils.analysis import KMeansAnalyzer
+
+
+@pytest.fixture
+def blobs():
+    rng = np.random.RandomState(0)
+    centers = np.array([[0, 0], [10, 0], [0, 10]])
+    points = np.vstack([c + rng.normal(size=(50, 2)) for c in centers])
+    return pd.DataFrame(points, columns=["x", "y"], index=rng.permutation(1000)[:150])
+
+
+def test_explore_dataframe(blobs, tmp_path):
+    analyzer = KMeansAnalyzer(KMeans(n_init=3, random_state=0), blobs, silhouette_sample=60,
+                              cache_dir=str(tmp_path))
+    analyzer.explore(range(1, 6))
+    analyzer._calculate_silhouette()
+
+    assert list(analyzer._inertia) == [1, 2, 3, 4, 5]
+    assert np.isnan(analyzer._silhouette[1])
+    assert max(analyzer._silhouette, key=lambda k: np.nan_to_num(analyzer._silhouette[k], nan=-1)) == 3
+
+    cached = KMeansAnalyzer(KMeans(n_init=3, random_state=0), blobs.values, silhouette_sample=60,
+                            cache_dir=str(tmp_path))
+    cached.explore(range(1, 6))
+    assert cached._inertia == analyzer._inertia
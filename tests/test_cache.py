@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from datamining.cache import ResponseCache
+
+
+def test_eviction_keeps_size_bound(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=2000)
+    for i in range(100):
+        cache.set({"value": "x" * 50}, "post", i)
+    assert cache._size <= 2000
+    assert cache.get("post", 99) == {"value": "x" * 50}
+    assert cache.get("post", 0) is None
+
+
+def test_shared_by_threads(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=5000)
+
+    def work(thread):
+        for i in range(200):
+            cache.set({"thread": thread, "i": i}, "post", thread, i)
+            data = cache.get("post", thread, i // 2)
+            assert data is None or data == {"thread": thread, "i": i // 2}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(work, range(8)))  # re-raises errors of workers
+    size = sum(f.stat().st_size for f in tmp_path.iterdir() if f.suffix == ".json")
+    assert size == cache._size <= 5000
@@ -0,0 +1,42 @@
+import numpy as np
+import scipy.sparse as sp
+
+from recommender.ann import BruteForceIndex
+from recommender.collaborative import HybridRecommender, ItemItemCF
+from recommender.incremental import IncrementalRecommender
+
+
+POSTS = ["a", "b", "c", "d"]
+LIKES = sp.csr_matrix(np.array([
+    [1, 1, 0, 1],
+    [1, 1, 0, 0],
+    [0, 1, 1, 1],
+    [1, 0, 1, 1],
+]))
+
+
+def models():
+    collaborative = ItemItemCF(n_neighbors=3).fit(LIKES, POSTS)
+    content = IncrementalRecommender(index=BruteForceIndex())
+    content.add(POSTS, [["кот", "собака"], ["кот"], [], ["собака"]])
+    return content, collaborative
+
+
+def test_blends_models():
+    content, collaborative = models()
+    distances, ids = HybridRecommender(content, collaborative).similar_posts(["a", "c"], 3)
+    assert ids[0][0] == "b"
+    assert set(ids[1]) <= {"a", "b", "d"}  # no text, recommended by likes only
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_retired_posts_are_not_recommended():
+    content, collaborative = models()
+    content.remove(["a", "d"])
+    hybrid = HybridRecommender(content, collaborative)
+    _, ids = hybrid.similar_posts(["a", "b", "c", "d"], 3)
+    assert all(p in content for row in ids for p in row)
+    assert ids[0] and ids[3]  # retired posts still get live recommendations by likes
+
+    _, ids = HybridRecommender(None, collaborative).similar_posts(["b"], 3)
+    assert "a" in ids[0]
@@ -0,0 +1,28 @@
+import pytest
+
+from recommender.ann import BruteForceIndex, LSHIndex
+from recommender.incremental import IncrementalRecommender
+
+
+@pytest.fixture(params=[BruteForceIndex, LSHIndex])
+def recommender(request):
+    return IncrementalRecommender(index=request.param())
+
+
+def test_repeated_ids_are_added_once(recommender):
+    recommender.add(["a", "a", "b"], [["кот", "собака"], ["кот"], ["кот", "мышь"]])
+    assert len(recommender) == 2
+    assert recommender.similar_posts(["b"], 3)[1] == [["a"]]
+
+    recommender.remove(["a"])
+    assert len(recommender) == 1
+    assert recommender.similar_posts(["b"], 3)[1] == [[]]
+    assert recommender.query([["кот"]], 3)[1] == [["b"]]
+
+
+def test_unrelated_posts_are_not_recommended(recommender):
+    recommender.add(["a", "b", "c"], [["кот", "собака"], ["кот"], []])
+    distances, ids = recommender.query([["кот"], ["слон"], []], 3)
+    assert ids == [["b", "a"], [], []]
+    assert distances[0, 0] == pytest.approx(0)
+    assert recommender.similar_posts(["c"], 3)[1] == [[]]
@@ -0,0 +1,60 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import resources
+from utils.preprocessing import NoSpaceSplitter, TextProcessing
+
+
+STOP_WORDS = {"и", "в", "на", "с"}
+CORPUS = pd.Series([
+    "Мастер-класс по рисованию акварелью для детей и взрослых",
+    "Йога на крыше в субботу, берите коврики",
+    "",
+    "Бесплатная лекция о современном искусстве в музее",
+    "Кулинарный мастер-класс: готовим пасту с шефом",
+    "Рисование маслом, мастер-класс для начинающих",
+    "Лекция о космосе для детей",
+] * 3, index=range(100, 121))
+
+
+@pytest.fixture(scope="module")
+def processing():
+    pytest.importorskip("pymorphy2")
+    try:
+        resources.morph_analyzer()
+    except AttributeError as e:  # pymorphy2 0.8 uses inspect.getargspec, removed in python 3.11
+        pytest.skip(f"pymorphy2 is not usable: {e}")
+    return TextProcessing(stop_words=STOP_WORDS)
+
+
+def test_parallel_transform_equals_serial(processing):
+    serial = processing.transform(CORPUS)
+    parallel = processing.transform(CORPUS, n_jobs=2, chunks_per_job=2)
+    pd.testing.assert_series_equal(parallel, serial)
+
+
+def test_transform_ids_equals_encoded_transform(processing):
+    serial = TextProcessing(stop_words=STOP_WORDS)
+    parallel = TextProcessing(stop_words=STOP_WORDS)
+    indptr, indices = serial.transform_ids(CORPUS)
+    parallel_indptr, parallel_indices = parallel.transform_ids(CORPUS, n_jobs=2, chunks_per_job=2)
+
+    np.testing.assert_array_equal(parallel_indptr, indptr)
+    np.testing.assert_array_equal(parallel_indices, indices)
+    assert serial.vocabulary.items() == parallel.vocabulary.items()
+    assert serial.vocabulary.decode((indptr, indices)) == processing.transform(CORPUS).tolist()
+
+
+def test_segment_recovers_words():
+    splitter = NoSpaceSplitter(Counter({"мастер": 5, "класс": 5, "для": 10, "детей": 3, "дети": 1}))
+    assert splitter.segment("мастерклассдлядетей") == ["мастер", "класс", "для", "детей"]
+    assert splitter.segment("йога") == ["йога"]
+    assert splitter.segment("") == []
+
+
+def test_segment_long_text_without_recursion_limit():
+    splitter = NoSpaceSplitter(Counter({"мастер": 5, "класс": 5}))
+    assert splitter.segment("мастеркласс" * 2000) == ["мастер", "класс"] * 2000
@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+from datamining.files import csv_to_store
+from datamining.store import PostStore
+
+
+def posts(post_ids, likes, tag="cats"):
+    return pd.DataFrame({
+        "post_id": post_ids,
+        "text": [f"post {p}" for p in post_ids],
+        "date": [100 + i for i in range(len(post_ids))],
+        "likes": likes,
+        "owner_id": 1,
+        "is_video": False,
+        "by_tag": tag,
+    })
+
+
+def test_compact_keeps_newest_row(tmp_path):
+    store = PostStore(str(tmp_path))
+    for likes in range(1, 10):  # many appends, so random part order would be caught
+        store.append(posts(["a", "b"], [likes, 0]))
+    store.append(posts(["c"], [5]))
+
+    assert store.compact() == 10
+    assert len(os.listdir(tmp_path / "by_tag=cats")) == 1
+    df = store.read().set_index("post_id")
+    assert df.likes.to_dict() == {"a": 9, "b": 0, "c": 5}
+
+    store.append(posts(["a"], [42]))
+    assert store.compact(min_parts=3) == 0
+    assert store.compact() == 2
+    assert store.read().set_index("post_id").likes["a"] == 42
+
+
+def test_read_filters(tmp_path):
+    store = PostStore(str(tmp_path))
+    store.append(posts(["a", "b", "c"], [1, 2, 3]))
+    store.append(posts(["d"], [4], tag="dogs"))
+
+    assert sorted(store.read(start=101).post_id) == ["b", "c"]
+    assert list(store.read(columns=["post_id"], tags=["dogs", "unknown"]).post_id) == ["d"]
+    assert list(store.read(tags=[]).columns) == list(store.read().columns)
+
+
+def test_csv_to_store_keeps_tags_with_underscores(tmp_path):
+    folder = tmp_path / "posts"
+    folder.mkdir()
+    posts(["a"], [1], tag="мк_studio").to_csv(folder / "мк_studio_11.csv", sep=";", index=False)
+    posts(["b"], [1]).drop(columns="by_tag").to_csv(folder / "svidanie_мастерклассы_138.csv", sep=";", index=False)
+
+    store = PostStore(str(tmp_path / "store"))
+    assert csv_to_store(str(folder), store) == 2
+    assert store.tags() == ["svidanie_мастерклассы", "мк_studio"]
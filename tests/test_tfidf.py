@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from utils.tfidf import ArrayTfidfVectorizer, concat_rows, filter_tokens
+from utils.vocabulary import Vocabulary
+
+
+DOCS = [
+    ["мастер", "класс", "рисование", "акварель", "ребёнок"],
+    ["йога", "крыша", "суббота", "коврик", "йога"],
+    [],
+    ["лекция", "искусство", "музей", "лекция", "лекция"],
+    ["мастер", "класс", "паста", "шеф"],
+    ["рисование", "масло", "мастер", "класс"],
+    ["лекция", "космос", "ребёнок"],
+]
+
+
+@pytest.mark.parametrize("params", [
+    dict(),
+    dict(max_df=0.95, min_df=2),
+    dict(min_df=2, sublinear_tf=True),
+    dict(smooth_idf=False, norm="l1"),
+])
+def test_matches_sklearn(params):
+    vocabulary = Vocabulary()
+    tokens = vocabulary.encode(DOCS)
+    vectorizer = ArrayTfidfVectorizer(**params)
+    X = vectorizer.fit_transform(tokens, len(vocabulary))
+
+    sk = TfidfVectorizer(analyzer=lambda doc: doc, **params)
+    expected = sk.fit_transform(DOCS)
+    columns = [sk.vocabulary_[vocabulary.item(i)] for i in vectorizer.features_]
+    np.testing.assert_allclose(X.toarray(), expected[:, columns].toarray(), atol=1e-12)
+    np.testing.assert_allclose(vectorizer.idf_, sk.idf_[columns])
+
+    new_docs = [["мастер", "космос", "неизвестное"], []]
+    new = vectorizer.transform(vocabulary.encode([[w for w in doc if w in vocabulary] for doc in new_docs]))
+    np.testing.assert_allclose(new.toarray(), sk.transform(new_docs)[:, columns].toarray(), atol=1e-12)
+
+
+def test_concat_and_filter_tokens():
+    vocabulary = Vocabulary()
+    text = vocabulary.encode([["a", "b"], [], ["c"]])
+    tags = vocabulary.encode([["x"], ["y", "z"], []])
+    joined = concat_rows(text, tags)
+    assert vocabulary.decode(joined) == [["a", "b", "x"], ["y", "z"], ["c"]]
+
+    keep = np.array([w not in {"b", "y"} for w in vocabulary.items()])
+    assert vocabulary.decode(filter_tokens(joined, keep)) == [["a", "x"], ["z"], ["c"]]
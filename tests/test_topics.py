@@ -0,0 +1,17 @@
+import pytest
+
+from utils import topics
+
+
+@pytest.mark.parametrize("text", [
+    "вкусный торт на заказ",
+    "тортик",
+    ["торт"],
+    ["вкусный", "тортик"],
+    {"торт", "йога"},
+    "",
+    [],
+])
+def test_map_text_topics_matches_baseline(text):
+    expected = {tpc for tpc, words in topics.TOPICS.items() for w in words if w in text}
+    assert topics.map_text_topics(text) == expected
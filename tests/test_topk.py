@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.neighbors import NearestNeighbors
+
+from recommender.topk import all_pairs_top_k, top_k_similar
+
+
+def random_posts(n, n_features=60, seed=0):
+    X = sp.random(n, n_features, density=0.1, random_state=seed, format="csr")
+    diagonal = sp.csr_matrix((np.ones(n), (np.arange(n), np.arange(n) % n_features)), shape=X.shape)
+    return (X + diagonal).tocsr()  # no zero rows
+
+
+def brute_force(Q, X, k):
+    return NearestNeighbors(metric="cosine", algorithm="brute").fit(X).kneighbors(Q, k)
+
+
+@pytest.mark.parametrize("block_size, n_jobs", [(None, 1), (7, 1), (7, 3), (1, 2)])
+def test_matches_brute_force(block_size, n_jobs):
+    X, Q = random_posts(300), random_posts(40, seed=1)
+    distances, indices = top_k_similar(Q, X, k=5, block_size=block_size, n_jobs=n_jobs)
+    expected_distances, expected_indices = brute_force(Q, X, 5)
+    np.testing.assert_allclose(distances, expected_distances, atol=1e-12)
+    np.testing.assert_array_equal(indices, expected_indices)
+
+
+def test_small_max_block_bytes():
+    X, Q = random_posts(300), random_posts(40, seed=1)
+    distances, indices = top_k_similar(Q, X, k=5, max_block_bytes=16 * 300 * 3)
+    np.testing.assert_array_equal(indices, brute_force(Q, X, 5)[1])
+
+
+def test_all_pairs_excludes_self():
+    X = random_posts(100)
+    distances, indices = all_pairs_top_k(X, k=4, block_size=9)
+    expected_distances, expected_indices = brute_force(X, X, 5)
+    assert not (indices == np.arange(100)[:, None]).any()
+    np.testing.assert_allclose(distances, expected_distances[:, 1:], atol=1e-12)
+    np.testing.assert_array_equal(indices, expected_indices[:, 1:])
+
+
+def test_valid_and_padding():
+    X = random_posts(10)
+    valid = np.arange(10) % 2 == 0
+    distances, indices = top_k_similar(X[:3], X, k=8, valid=valid)
+    expected_distances, expected_indices = brute_force(X[:3], X[valid], 5)
+    np.testing.assert_array_equal(indices[:, :5], np.flatnonzero(valid)[expected_indices])
+    np.testing.assert_allclose(distances[:, :5], expected_distances, atol=1e-12)
+    assert (indices[:, 5:] == -1).all() and np.isinf(distances[:, 5:]).all()
@@ -1,32 +1,75 @@
 import re
 import os
+import hashlib
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 import matplotlib.pyplot as plt
 
 from sklearn import metrics
+from sklearn.base import clone
+from sklearn.metrics import pairwise_distances_argmin_min
 
 
 class KMeansAnalyzer:
     """
     Helps to determine number of clusters according
     to mean squared distance or silhouette metric.
+    Candidate numbers of clusters are fitted in worker processes, every one by its own
+    copy of clusterer, results could be cached on disk by (data hash, k).
     """
 
-    def __init__(self, clusterer, data, verbose=False):
+    def __init__(self, clusterer, data, verbose=False, n_jobs=1, warm_start=True, silhouette_sample=10000,
+                 random_state=17, cache_dir=None):
         """
         :param clusterer: an instance of sklearn.cluster.KMeans or MiniBatchKMeans
-        :param data: data array to fit clusterer
+        :param data: data array, pandas.DataFrame or sparse matrix to fit clusterer
         :param verbose: if True will print the current state while executing methods
+        :param n_jobs: number of worker processes, -1 means all cores, 1 - no workers
+        :param warm_start: if True clusterer for k is initialized with centers of k - 1 clusters
+        plus the point farthest from them, fitted ks are split into contiguous ranges per worker for that
+        :param silhouette_sample: number of points silhouette is calculated on, all points if None
+        :param random_state: random state of silhouette sample
+        :param cache_dir: folder to cache fitting results and silhouettes in, no cache if None
         """
         self._clusterer = clusterer
-        self._data = data
+        # rows are picked by position for warm start and silhouette sample
+        self._data = data if sp.issparse(data) else np.asarray(data)
         self._verbose = verbose
+        self._n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self._warm_start = warm_start
+        self._silhouette_sample = silhouette_sample
+        self._random_state = random_state
+        self._cache_dir = cache_dir
         self._inertia = {}
         self._labels = {}
+        self._centers = {}
         self._silhouette = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._key = _data_hash(self._data, clusterer)
+
+    def _cache_file(self, name):
+        return os.path.join(self._cache_dir, f"{self._key}_{name}")
+
+    def _load(self, k):
+        """Loads fitting results for k clusters from cache, returns True if found"""
+        if self._cache_dir is None:
+            return False
+        try:
+            with np.load(self._cache_file(f"{k}.npz")) as f:
+                self._inertia[k], self._labels[k], self._centers[k] = float(f["inertia"]), f["labels"], f["centers"]
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def _save(self, k):
+        if self._cache_dir is not None:
+            np.savez(self._cache_file(f"{k}.npz"), inertia=self._inertia[k], labels=self._labels[k],
+                     centers=self._centers[k])
 
     def explore(self, range_inst: "range"):
         """
@@ -34,16 +77,28 @@ class KMeansAnalyzer:
         :param range_inst: range of clusters to fit
         :return: None
         """
-        for k in range_inst:
-            if k in self._inertia:
-                continue
-            if self._verbose:
-                print(f"fitting {k} clusters")
-            self._clusterer.n_clusters = k
-            self._clusterer.init_size = k * 3
-            self._clusterer.fit(self._data)
-            self._inertia.update({k: np.sqrt(self._clusterer.inertia_)})
-            self._labels.update({k: self._clusterer.labels_})
+        ks = [k for k in range_inst if k not in self._inertia and not self._load(k)]
+        if not ks:
+            return
+
+        n_chunks = min(len(ks), self._n_jobs)
+        bounds = np.linspace(0, len(ks), n_chunks + 1).astype(int)
+        chunks = [ks[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        # every chunk starts from centers of previous k if they are known
+        args = [(self._clusterer, self._data, chunk, self._centers.get(chunk[0] - 1), self._warm_start,
+                 self._verbose) for chunk in chunks]
+        if n_chunks == 1:
+            results = [_fit_range(*args[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+                results = list(pool.map(_fit_range, *zip(*args)))
+
+        for chunk in results:
+            for k, (inertia, labels, centers) in chunk.items():
+                self._inertia[k], self._labels[k], self._centers[k] = inertia, labels, centers
+                self._save(k)
+        self._inertia = dict(sorted(self._inertia.items()))
+        self._labels = dict(sorted(self._labels.items()))
 
     def plot_inertia(self):
         plt.plot(self._inertia.keys(), self._inertia.values(), marker='s')
@@ -51,11 +106,29 @@ class KMeansAnalyzer:
         plt.ylabel('$J(C_k)$')
 
     def _calculate_silhouette(self):
+        n = self._data.shape[0]
+        sample = None
+        if self._silhouette_sample is not None and self._silhouette_sample < n:
+            sample = np.random.RandomState(self._random_state).choice(n, self._silhouette_sample, replace=False)
+        data = self._data if sample is None else self._data[sample]
+
         for k, labels in self._labels.items():
-            if k not in self._silhouette:
-                if self._verbose:
-                    print(f"Calculating silhouette for {k} clusters")
-                self._silhouette.update({k: metrics.silhouette_score(self._data, labels)})
+            if k in self._silhouette:
+                continue
+            cache_file = self._cache_file(f"{k}_silhouette_{self._silhouette_sample}_{self._random_state}.npy") \
+                if self._cache_dir is not None else None
+            if cache_file is not None and os.path.exists(cache_file):
+                self._silhouette[k] = float(np.load(cache_file))
+                continue
+            if self._verbose:
+                print(f"Calculating silhouette for {k} clusters")
+            labels = labels if sample is None else labels[sample]
+            # silhouette of one cluster is undefined
+            score = metrics.silhouette_score(data, labels) if len(np.unique(labels)) > 1 else np.nan
+            self._silhouette[k] = score
+            if cache_file is not None:
+                np.save(cache_file, score)
+        self._silhouette = dict(sorted(self._silhouette.items()))
 
     def plot_silhouette(self):
         self._calculate_silhouette()
@@ -64,23 +137,200 @@ class KMeansAnalyzer:
         plt.ylabel('$Silhouette$')
 
 
+def _data_hash(data, clusterer):
+    """Hex digest of data and clusterer parameters which do not depend on number of clusters"""
+    h = hashlib.sha1()
+    if sp.issparse(data):
+        data = data.tocsr()
+        for arr in (data.data, data.indices, data.indptr):
+            h.update(np.ascontiguousarray(arr).tobytes())
+    else:
+        h.update(np.ascontiguousarray(data).tobytes())
+    h.update(repr(data.shape).encode("utf-8"))
+    params = {k: v for k, v in clusterer.get_params().items() if k not in {"n_clusters", "init_size", "init"}}
+    h.update(f"{type(clusterer).__name__}{sorted(params.items())}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _grow_centers(data, centers):
+    """Returns centers plus the data point farthest from its nearest center"""
+    farthest = pairwise_distances_argmin_min(data, centers)[1].argmax()
+    point = data[farthest]
+    point = point.toarray() if sp.issparse(point) else np.asarray(point).reshape(1, -1)
+    return np.vstack([centers, point])
+
+
+def _fit_range(clusterer, data, ks, centers, warm_start, verbose):
+    """
+    Fits fresh copy of clusterer for every k of contiguous ks
+    :param centers: centers of ks[0] - 1 clusters or None
+    :return: dict k -> (sqrt of inertia, labels, centers)
+    """
+    res = {}
+    for k in ks:
+        if verbose:
+            print(f"fitting {k} clusters")
+        est = clone(clusterer)
+        params = {"n_clusters": k}
+        if "init_size" in est.get_params():
+            params["init_size"] = k * 3
+        if warm_start and centers is not None and len(centers) == k - 1:
+            params.update(init=_grow_centers(data, centers), n_init=1)
+        est.set_params(**params)
+        est.fit(data)
+        centers = est.cluster_centers_
+        res[k] = (np.sqrt(est.inertia_), est.labels_, centers)
+    return res
+
+
+class CountMinSketch:
+    """
+    Approximate counts in fixed memory, estimate is never less than true count.
+    Sketches with equal width, depth and seed could be merged.
+    """
+
+    def __init__(self, width=2 ** 20, depth=4, seed=0):
+        """
+        :param width: number of counters in row, error is about total count * e / width
+        :param depth: number of rows, error exceeds bound with probability exp(-depth)
+        :param seed: hash seed, sketches are comparable only with equal seeds
+        """
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, items):
+        """Returns array of shape (depth, len(items)) with column of every item in every row"""
+        key = self.seed.to_bytes(8, "little")
+        digests = np.array([int.from_bytes(hashlib.blake2b(str(item).encode("utf-8"), digest_size=8, key=key)
+                                           .digest(), "little") for item in items], dtype=np.uint64)
+        h1, h2 = digests & np.uint64(0xFFFFFFFF), digests >> np.uint64(32)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1 + rows * h2) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, counts: "dict"):
+        """Adds counts of items, dict item -> count"""
+        if not counts:
+            return
+        columns = self._columns(counts.keys())
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], values)
+
+    def estimate(self, items):
+        """Returns np.array of estimated counts of items"""
+        items = list(items)
+        if not items:
+            return np.zeros(0, dtype=np.int64)
+        return self.table[np.arange(self.depth)[:, None], self._columns(items)].min(axis=0)
+
+    def merge(self, other):
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("Sketches must have the same width, depth and seed")
+        self.table += other.table
+
+
 class FreqCounter:
-    def __init__(self):
+    """
+    Counts frequencies of items in iterable of iterables, e.g. tokens of texts.
+    Exact mode keeps every item, sketch mode keeps Count-Min sketch and top_k
+    most frequent items only, so memory is bounded for any vocabulary size.
+    Counters of corpus shards could be counted in parallel and merged.
+    """
+
+    def __init__(self, sketch=False, top_k=10000, width=2 ** 20, depth=4, batch_size=100000):
+        """
+        :param sketch: if True approximate counts are kept in Count-Min sketch
+        :param top_k: number of heavy hitters kept in sketch mode
+        :param width: sketch width
+        :param depth: sketch depth
+        :param batch_size: in sketch mode items are counted exactly in batches of that size before adding to sketch
+        """
         self._freqs = Counter()
-        self._data = pd.DataFrame()
+        self._frame = None
+        self.sketch = CountMinSketch(width, depth) if sketch else None
+        self.top_k = top_k
+        self.batch_size = batch_size
 
     def fit(self, iterable):
-        self._freqs.update([item for sub_item in iterable for item in sub_item])
+        """Same as partial_fit, counts are accumulated with previous calls"""
+        return self.partial_fit(iterable)
 
-        self._data = (pd.Series(self._freqs)
-                      .sort_values(ascending=False)
-                      .reset_index()
-                      .rename({"index": "item", 0: "freq"}, axis=1))
+    def partial_fit(self, iterable):
+        """
+        :param iterable: iterable of iterables of items, could be a generator
+        :return: self
+        """
+        if self.sketch is None:
+            for sub_item in iterable:
+                self._freqs.update(sub_item)
+        else:
+            batch = Counter()
+            for sub_item in iterable:
+                batch.update(sub_item)
+                if len(batch) >= self.batch_size:
+                    self._add_batch(batch)
+                    batch = Counter()
+            self._add_batch(batch)
+        self._frame = None
+        return self
+
+    def _add_batch(self, batch):
+        self.sketch.add(batch)
+        for item in batch:
+            self._freqs[item] = 0  # candidate, estimated below
+        self._update_heavy_hitters(prune=len(self._freqs) > 2 * self.top_k)
+
+    def _update_heavy_hitters(self, prune=True):
+        items = list(self._freqs)
+        self._freqs = Counter(dict(zip(items, self.sketch.estimate(items).tolist())))
+        if prune:
+            self._freqs = Counter(dict(self._freqs.most_common(self.top_k)))
 
+    def merge(self, *others):
+        """
+        Adds counts of other counters, e.g. fitted on other shards of corpus
+        :return: self
+        """
+        for other in others:
+            if (self.sketch is None) != (other.sketch is None):
+                raise ValueError("Exact and sketch counters could not be merged")
+            if self.sketch is None:
+                self._freqs.update(other._freqs)
+            else:
+                self.sketch.merge(other.sketch)
+                self._freqs.update(dict.fromkeys(other._freqs, 0))
+        if self.sketch is not None and others:
+            self._update_heavy_hitters()
+        self._frame = None
         return self
 
+    @property
+    def total(self):
+        """Total number of counted items"""
+        if self.sketch is None:
+            return sum(self._freqs.values())
+        return int(self.sketch.table[0].sum())
+
+    def counter(self):
+        """Returns collections.Counter of items, e.g. for NoSpaceSplitter, only heavy hitters in sketch mode"""
+        return Counter(self._freqs)
+
+    def estimate(self, item):
+        """Returns count of item, estimated by sketch in sketch mode"""
+        if self.sketch is None or item in self._freqs:
+            return self._freqs[item]
+        return int(self.sketch.estimate([item])[0])
+
+    @property
+    def _data(self):
+        if self._frame is None:
+            self._frame = pd.DataFrame(self._freqs.most_common(), columns=["item", "freq"])
+        return self._frame
+
     def data(self, max_df=0.95):
-        if self._data:
+        if not self._data.empty:
             return self._data[self._data["freq"] <= self._data["freq"].quantile(max_df)]
         else:
             raise ValueError("Data was not found")
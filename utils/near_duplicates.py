@@ -0,0 +1,125 @@
+"""
+Near-duplicate detection for tokenized posts with MinHash and locality sensitive hashing.
+
+Every document is turned into a set of word shingles, MinHash signature estimates Jaccard
+similarity of two sets as the share of equal signature values. Signatures are split in bands,
+documents sharing any band bucket become candidates and are joined into clusters
+if their estimated similarity reaches the threshold.
+"""
+
+
+import zlib
+
+import numpy as np
+
+
+PRIME = (1 << 31) - 1  # hash values are 32 bit, so a * x + b fits in uint64
+EMPTY_SHINGLE = 0  # all documents without tokens share one signature
+
+
+def shingles(tokens, k=3):
+    """
+    :param tokens: list of words
+    :param k: number of words in shingle, shorter documents are a single shingle
+    :return: set of 32 bit shingle hashes
+    """
+    if not tokens:
+        return {EMPTY_SHINGLE}
+    k = min(k, len(tokens))
+    return {zlib.crc32(" ".join(tokens[i:i + k]).encode("utf-8")) for i in range(len(tokens) - k + 1)}
+
+
+def lsh_params(threshold, num_perm):
+    """
+    Chooses number of bands and rows per band so that probability curve (1 / bands) ** (1 / rows)
+    crosses at the threshold.
+    :return: (bands, rows)
+    """
+    return min(((b, num_perm // b) for b in range(1, num_perm + 1)),
+               key=lambda p: abs((1 / p[0]) ** (1 / p[1]) - threshold))
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures with num_perm universal hash functions (a * x + b) mod PRIME.
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        """
+        :param num_perm: signature length
+        :param seed: random seed of hash functions, signatures are comparable only with equal seeds
+        """
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, PRIME, num_perm).astype(np.uint64)
+        self.b = rng.randint(0, PRIME, num_perm).astype(np.uint64)
+
+    def signatures(self, shingle_sets, batch_size=100000):
+        """
+        :param shingle_sets: list of sets of shingle hashes
+        :param batch_size: approximate number of shingles hashed at once, bounds memory usage
+        :return: np.array of shape (len(shingle_sets), num_perm)
+        """
+        res = np.empty((len(shingle_sets), self.num_perm), dtype=np.uint64)
+        start = 0
+        while start < len(shingle_sets):
+            stop, size = start, 0
+            while stop < len(shingle_sets) and (size == 0 or size + len(shingle_sets[stop]) <= batch_size):
+                size += len(shingle_sets[stop])
+                stop += 1
+
+            batch = shingle_sets[start:stop]
+            values = np.fromiter((x for s in batch for x in s), dtype=np.uint64, count=size)
+            offsets = np.cumsum([0] + [len(s) for s in batch[:-1]])
+            hashed = (values[:, None] * self.a + self.b) % PRIME
+            res[start:stop] = np.minimum.reduceat(hashed, offsets, axis=0)
+            start = stop
+        return res
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster(signatures, threshold=0.8):
+    """
+    Groups documents with estimated Jaccard similarity >= threshold.
+    Every bucket member is compared with the first document of the bucket only,
+    so the work is linear in number of documents.
+    :param signatures: np.array of MinHash signatures, one row per document
+    :param threshold: min Jaccard similarity of near-duplicates
+    :return: np.array of cluster ids, cluster id is the position of its first document
+    """
+    n, num_perm = signatures.shape
+    bands, rows = lsh_params(threshold, num_perm)
+    parent = list(range(n))
+
+    for band in range(bands):
+        chunk = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        buckets = {}
+        for i in range(n):
+            first = buckets.setdefault(chunk[i].tobytes(), i)
+            if first == i:
+                continue
+            a, b = _find(parent, first), _find(parent, i)
+            if a != b and np.mean(signatures[first] == signatures[i]) >= threshold:
+                parent[max(a, b)] = min(a, b)
+
+    return np.array([_find(parent, i) for i in range(n)])
+
+
+def near_duplicate_clusters(docs, threshold=0.8, num_perm=128, k=3, seed=1):
+    """
+    :param docs: iterable of token lists
+    :param threshold: min Jaccard similarity of shingle sets to treat documents as duplicates
+    :param num_perm: MinHash signature length, longer is more accurate and slower
+    :param k: number of words in shingle
+    :param seed: random seed of hash functions
+    :return: np.array of cluster ids, cluster id is the position of its first document
+    """
+    shingle_sets = [shingles(tokens, k) for tokens in docs]
+    signatures = MinHasher(num_perm, seed).signatures(shingle_sets)
+    return cluster(signatures, threshold)
@@ -1,17 +1,42 @@
 import re
 import os
-from collections import Counter, Iterable
+import pickle
+import hashlib
+from math import log
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Iterable
 
 import pandas as pd
 import numpy as np
 
-from pymorphy2 import MorphAnalyzer
-from nltk.corpus import stopwords
+from utils import resources
+from utils.vocabulary import Vocabulary
+from utils.near_duplicates import near_duplicate_clusters
 
 
-CITIES = set(pd.read_csv("./data/cities_.csv", sep=";", header=None)[1].values)
-SPECIAL_WORDS = set(pd.read_csv("./data/special_words.csv", index_col=0, header=None)[1].values)
-STOPWORDS = set(stopwords.words("russian"))
+LOG_10 = log(10)
+
+FEATURE_COLUMNS = ("phone_number", "direct", "price", "tags")
+# texts are scanned lowercased: Russian mobile phone | instagram direct | price | hash tag,
+# hash tag is a lookahead so words inside tags are still scanned for other features,
+# leading lookahead skips positions where no feature can start
+FEATURES_PAT = re.compile(
+    r"(?=[\d+|\s\-.(дd#])(?:"
+    r"(?P<phone>[\+7|7|8]?[\s\-.]?\(?[489][0-9]{2}\)?[\s\-.]?[0-9]{3}[\s\-.]?[0-9]{2}[\s\-.]?[0-9]{2})"
+    r"|(?P<direct>директ|direct)"
+    r"|(?P<price>[\d]+0)\s?[р₽]"  # "420 р" and "4000р" are prices, "421" is not
+    r"|#(?=(?P<tag>[a-zа-я_]+)))"
+)
+MAX_PRICE_LEN = 5
+# word sets are loaded on first access, see utils.resources
+_RESOURCES = {"CITIES": resources.cities, "SPECIAL_WORDS": resources.special_words, "STOPWORDS": resources.stopwords}
+
+
+def __getattr__(name):
+    if name in _RESOURCES:
+        return _RESOURCES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class FeatureExtractor:
@@ -25,67 +50,102 @@ class FeatureExtractor:
             if f not in df:
                 raise ValueError(f"DataFrame must contain {f} column")
 
-    def drop_duplicates(self, df: pd.DataFrame):
-        self._check_fields(df, ["text"])
-        df = df.copy()
-
-        return (df.assign(tokens=df["text"].map(TextProcessing().tokenize).str.join(""))
-                  .drop_duplicates("tokens")
-                  .drop("tokens", axis=1))
+    _text_processing = None
 
-    def add_contacts(self, df: "pd.DataFrame"):
-        """Add phone number and bollean direct features"""
+    @property
+    def text_processing(self):
+        """TextProcessing instance created on first use and reused by all calls"""
+        if self._text_processing is None:
+            self._text_processing = TextProcessing()
+        return self._text_processing
 
+    def drop_duplicates(self, df: pd.DataFrame, mode="exact", threshold=0.8, return_clusters=False, num_perm=128):
+        """
+        Removes duplicated posts, first post of every group of duplicates is left.
+        :param df: DataFrame with text column
+        :param mode: 'exact' drops posts with equal token sequences, 'minhash' drops near-duplicates
+        with estimated Jaccard similarity of word shingles >= threshold
+        :param threshold: min similarity in 'minhash' mode
+        :param return_clusters: if True pd.Series of cluster ids for all rows of df is returned as well,
+        cluster id is the position of the first post of the cluster in df
+        :param num_perm: MinHash signature length in 'minhash' mode
+        :return: filtered DataFrame or (filtered DataFrame, clusters)
+        """
         self._check_fields(df, ["text"])
-        df = df.copy()
+        tokens = df["text"].fillna("").map(self.text_processing.tokenize)
 
-        # Russian mobile phone | instagram direct pattern
-        contacts_pat = re.compile(
-            r"([\+7|7|8]?[\s\-.]?\(?[489][0-9]{2}\)?[\s\-.]?[0-9]{3}[\s\-.]?[0-9]{2}[\s\-.]?[0-9]{2})|(директ|Директ|direct)"
-        )
-        df[["phone_number", "direct"]] = df["text"].str.extract(contacts_pat)
+        if mode == "exact":
+            clusters = pd.Series(np.arange(len(df)), index=df.index).groupby(tokens.str.join("").values).transform("min")
+        elif mode == "minhash":
+            clusters = pd.Series(near_duplicate_clusters(tokens.values, threshold, num_perm), index=df.index)
+        else:
+            raise ValueError("Unknown mode")
 
+        res = df[clusters.values == np.arange(len(df))]
+        if return_clusters:
+            return res, clusters.rename("cluster")
+        return res
+
+    def extract(self, texts: "pd.Series"):
+        """
+        Scans every text once and extracts all features together.
+        :param texts: pd.Series of post texts
+        :return: pd.DataFrame with phone_number, direct, price and tags columns, same index as texts
+        """
+        phones, directs, prices, tags = [], [], [], []
+        for text in texts.values:
+            phone, direct, price, text_tags = _scan_features(text)
+            phones.append(phone)
+            directs.append(direct)
+            prices.append(price)
+            tags.append(text_tags)
+
+        return pd.DataFrame({"phone_number": pd.Series(phones, index=texts.index, dtype=object),
+                             "direct": pd.Series(directs, index=texts.index, dtype=object),
+                             "price": pd.Series(prices, index=texts.index, dtype="int64"),
+                             "tags": pd.Series(tags, index=texts.index, dtype=object)})
+
+    def add_features(self, df: "pd.DataFrame", columns=FEATURE_COLUMNS, inplace=True):
+        """
+        Adds features with single pass over texts.
+        :param df: DataFrame with text column, by_tag column is added to tags if present
+        :param columns: features to add, any of FEATURE_COLUMNS
+        :param inplace: if True columns are added to df itself, otherwise to its copy
+        :return: DataFrame with features
+        """
+        self._check_fields(df, ["text"])
+        features = self.extract(df["text"])
+        if "tags" in columns and "by_tag" in df:
+            for tags, tag in zip(features["tags"].values, df["by_tag"].values):
+                tags.add(tag)  # fill if tag was not found
+
+        if not inplace:
+            return df.assign(**{c: features[c] for c in columns})
+        for c in columns:
+            df[c] = features[c]
         return df
 
+    def add_contacts(self, df: "pd.DataFrame"):
+        """Add phone number and bollean direct features"""
+        return self.add_features(df, ["phone_number", "direct"], inplace=False)
+
     def add_price(self, df: "pd.DataFrame"):
         """Add price feature"""
-
-        self._check_fields(df, ["text"])
-        df = df.copy()
-
-        price_pat = re.compile(r"([\d]+0)\s?[рР₽]")  # "420 р" and "4000р" are prices, "421" is not
-        df["price"] = (df["text"].str.lower()
-                       .str.extract(price_pat)
-                       .fillna(0)
-                       .iloc[:, 0]  # convert to Series
-                       .map(lambda x: 0 if isinstance(x, str) and len(x) > 5 else x)
-                       .astype("int64"))
-        return df
+        return self.add_features(df, ["price"], inplace=False)
 
     def filter_workshops(self, df: "pd.DataFrame"):
         """Remove all rows that are not workshops"""
 
-        df = df.copy()
-        df = (df.pipe(self.add_contacts)
-                .pipe(self.add_price))
-
-        contact_filter = df[["phone_number", "direct"]].notnull().any(axis=1)
-        price_filter = df["price"] > 0
+        self._check_fields(df, ["text"])
+        features = self.extract(df["text"])
+        mask = (features["phone_number"].notnull() | features["direct"].notnull() | (features["price"] > 0)).values
 
-        return df[contact_filter or price_filter]
+        columns = ["phone_number", "direct", "price"]
+        return pd.concat([df[mask].drop(columns=columns, errors="ignore"), features.loc[mask, columns]], axis=1)
 
     def add_tags(self, df: "pd.DataFrame"):
         """Add tag feature with instagram hash tags"""
-
-        self._check_fields(df, ["text"])
-        df = df.copy()
-
-        tokenizer = TextProcessing(token_pat="#([a-zа-я_]+)").tokenize
-        df["tags"] = (df["text"].map(tokenizer)
-                      .map(set))
-
-        df.apply(lambda x: x["tags"].add(x["by_tag"]), axis=1)  # fill if tag was not found
-        return df
+        return self.add_features(df, ["tags"], inplace=False)
 
     def add_split_tags(self, df: "pd.DataFrame", counter):
         pass
@@ -94,28 +154,43 @@ class FeatureExtractor:
         pass
 
 
-def memo(func):
-    """
-    Memoize function f, whose args must all be hashable.
-    """
-    cache = {}
+def _scan_features(text):
+    """Returns (phone, direct, price, tags) of text, first match is taken for all but tags"""
+    phone = direct = price = None
+    tags = set()
+    if not isinstance(text, str):
+        return phone, direct, 0, tags
+
+    for m in FEATURES_PAT.finditer(text.lower()):
+        kind = m.lastgroup
+        if kind == "tag":
+            tags.add(m.group("tag"))
+        elif kind == "phone":
+            phone = phone or m.group("phone")
+        elif kind == "direct":
+            direct = direct or m.group("direct")
+        elif price is None:
+            price = m.group("price")
 
-    def wrapped(*args):
-        if args not in cache:
-            cache[args] = func(*args)
-        return cache[args]
-    return wrapped
+    price = int(price) if price and len(price) <= MAX_PRICE_LEN else 0
+    return phone, direct, price, tags
 
 
 class NoSpaceSplitter:
 
-    def __init__(self, counter: "Counter"):
+    def __init__(self, counter: "Counter", max_len=20, cache_size=100000):
         """
         Utility to recover the sequence of words from
         given sequence of characters with no spaces separating words.
         :param counter: collections.Counter object with words frequencies in text corpus
+        :param max_len: max length of single word
+        :param cache_size: max number of segmentations to keep in instance cache
         """
         self.p = self.pdist(counter)
+        self.counter = counter
+        self.max_len = max_len
+        self._log_n = log(sum(counter.values()) or 1)
+        self._cache = LRUCache(cache_size)
 
     @staticmethod
     def pdist(counter):
@@ -131,6 +206,16 @@ class NoSpaceSplitter:
         """
         return np.prod([self.p(w) for w in words])
 
+    def log_pword(self, word):
+        """
+        Log probability of word, unknown words get probability decreasing with their length,
+        so unknown sequence is kept whole instead of being split into characters.
+        """
+        count = self.counter[word]
+        if count:
+            return log(count) - self._log_n
+        return LOG_10 - self._log_n - len(word) * LOG_10
+
     @staticmethod
     def splits(text, start=0, max_len=20):
         """
@@ -139,17 +224,161 @@ class NoSpaceSplitter:
         return [(text[:i], text[i:])
                 for i in range(start, min(len(text), max_len) + 1)]
 
-    @memo
     def segment(self, text):
         """
         Return a list of words that is the most probable segmentation of text.
         """
-        if not text:
-            return []
+        words = self._cache.get(text)
+        if words is None:
+            words = self._viterbi(text)
+            self._cache.set(text, words)
+        return list(words)
 
-        candidates = [[first] + self.segment(rest)
-                      for (first, rest) in self.splits(text, 1)]
-        return max(candidates, key=self.pwords)
+    def segment_many(self, texts):
+        """
+        Segments many texts computing every unique text once
+        :param texts: iterable of str
+        :return: list of segmentations
+        """
+        texts = list(texts)
+        segmented = {text: self.segment(text) for text in set(texts)}
+        return [list(segmented[text]) for text in texts]
+
+    def _viterbi(self, text):
+        """
+        Dynamic programming over text prefixes in log probability space:
+        best[end] is the score of the best segmentation of text[:end].
+        """
+        n = len(text)
+        best = [0.] + [-np.inf] * n
+        back = [0] * (n + 1)
+        for end in range(1, n + 1):
+            for start in range(max(0, end - self.max_len), end):
+                score = best[start] + self.log_pword(text[start:end])
+                if score > best[end]:
+                    best[end], back[end] = score, start
+
+        words = []
+        end = n
+        while end > 0:
+            words.append(text[back[end]:end])
+            end = back[end]
+        return words[::-1]
+
+
+class LRUCache:
+    """
+    Bounded cache, least recently used entries are dropped. Could be saved to disk.
+    """
+
+    def __init__(self, max_size=500000):
+        """
+        :param max_size: max number of cached entries
+        """
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump((self.max_size, list(self._data.items())), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            max_size, items = pickle.load(f)
+        cache = cls(max_size)
+        cache._data.update(items)
+        return cache
+
+
+class LemmaCache(LRUCache):
+    """
+    Cache of lemmatizing results keyed by (word, allowed_pos).
+    Could be shared between TextProcessing instances.
+    """
+
+
+class PreprocessingCache:
+    """
+    Persistent results of TextProcessing.transform keyed by post id, so only new
+    or changed posts are processed again. Results of every TextProcessing configuration
+    are stored in separate '<config_key>.pickle' file in the folder.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: folder to store results in
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._entries = {}
+
+    def _file_name(self, config):
+        return os.path.join(self.path, f"{config}.pickle")
+
+    def entries(self, config):
+        """Returns dict post_id -> (doc digest, processed doc) of configuration, loaded on first use"""
+        if config not in self._entries:
+            try:
+                with open(self._file_name(config), "rb") as f:
+                    self._entries[config] = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self._entries[config] = {}
+        return self._entries[config]
+
+    def lookup(self, config, post_ids, digests):
+        """
+        :return: list of processed docs, None for posts which are missing or changed
+        """
+        entries = self.entries(config)
+        res = []
+        for post_id, digest in zip(post_ids, digests):
+            entry = entries.get(post_id)
+            res.append(entry[1] if entry is not None and entry[0] == digest else None)
+        return res
+
+    def update(self, config, post_ids, digests, docs):
+        self.entries(config).update(zip(post_ids, zip(digests, docs)))
+
+    def prune(self, config, post_ids):
+        """Leaves entries of post_ids only, e.g. of posts still present in store"""
+        entries = self.entries(config)
+        keep = set(post_ids)
+        for post_id in [p for p in entries if p not in keep]:
+            del entries[post_id]
+
+    def save(self, config):
+        """Rewrites configuration file, temporary file is used so interrupted save keeps old results"""
+        tmp = self._file_name(config) + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self.entries(config), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file_name(config))
+
+
+def _doc_digest(doc):
+    """Digest of raw text, or of sorted tokens if doc is already tokenized (e.g. set of tags)"""
+    if not isinstance(doc, str):
+        doc = "\x1f".join(sorted(doc)) if isinstance(doc, Iterable) else repr(doc)
+    return hashlib.blake2b(doc.encode("utf-8"), digest_size=16).digest()
 
 
 class TextProcessing:  # TODO: add stemming
@@ -164,11 +393,18 @@ class TextProcessing:  # TODO: add stemming
         others will be dropped
         :param stop_words: if None is passed default russian stopwords are used
         :param stop_cities: if True russian cities will be dropped
+        :param lemma_cache: LemmaCache to share lemmatizing results between instances,
+        if None new one is created
+        :param vocabulary: utils.vocabulary.Vocabulary to encode lemmas with in transform_ids,
+        could be shared between instances, e.g. for text and tags, if None new one is created
     """
 
     def __init__(self, token_pat="[а-я]+", mode="normal", counter=None, threshold=3,
-                 allowed_pos=None, stop_words=None, stop_cities=False):
-        self.token = token_pat
+                 allowed_pos=None, stop_words=None, stop_cities=False, lemma_cache=None, vocabulary=None):
+        # everything but shared cache is needed to rebuild the instance in worker process
+        self._params = dict(token_pat=token_pat, mode=mode, counter=counter, threshold=threshold,
+                            allowed_pos=allowed_pos, stop_words=stop_words, stop_cities=stop_cities)
+        self.token = re.compile(token_pat)
         self.mode = mode
 
         if self.mode not in {"normal", "nospace"}:
@@ -180,11 +416,18 @@ class TextProcessing:  # TODO: add stemming
             self.nospace = NoSpaceSplitter(counter)
             self.threshold = threshold
 
-        self.morph = MorphAnalyzer()
         self.allowed_pos = allowed_pos
-        self.stop_words = stop_words or STOPWORDS
+        self._pos_key = frozenset(allowed_pos) if allowed_pos else None
+        self.lemma_cache = lemma_cache if lemma_cache is not None else LemmaCache()
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.stop_words = stop_words or resources.stopwords()
         if stop_cities:
-            self.stop_words.union(CITIES)
+            self.stop_words = self.stop_words | resources.cities()
+
+    @property
+    def morph(self):
+        """MorphAnalyzer shared by all instances, loaded on first use"""
+        return resources.morph_analyzer()
 
     def tokenize(self, doc):
         """
@@ -193,7 +436,7 @@ class TextProcessing:  # TODO: add stemming
         :return: list of tokens
         """
         if isinstance(doc, str):
-            doc = re.findall(self.token, doc.lower())
+            doc = self.token.findall(doc.lower())
         elif not isinstance(doc, Iterable):
             raise ValueError("The doc must be a string or iterable")
         if self.mode == "nospace":
@@ -207,7 +450,7 @@ class TextProcessing:  # TODO: add stemming
             if len(split) <= self.threshold:
                 res.extend(split)
             else:
-                res.extend(w)
+                res.append(w)
         return res
 
     def lemmatize(self, doc):
@@ -217,18 +460,38 @@ class TextProcessing:  # TODO: add stemming
         """
         res = []
         for w in doc:
-            parsed = self.morph.parse(w)[0]
-            if parsed in SPECIAL_WORDS:
-                continue
-            if self.allowed_pos:
-                if parsed.tag.POS in self.allowed_pos:
-                    res.append(parsed.normal_form)
-                else:
-                    continue
-            else:
-                res.append(parsed.normal_form)
+            lemma = self._lemma(w)
+            if lemma is not None:
+                res.append(lemma)
         return res
 
+    def lemmatize_batch(self, docs):
+        """
+        Lemmatizes many documents resolving every unique word once
+        :param docs: iterable of lists of words
+        :return: list of lists with most probable normal forms of words
+        """
+        docs = list(docs)
+        lemmas = {w: self._lemma(w) for w in {w for doc in docs for w in doc}}
+        return [[lemmas[w] for w in doc if lemmas[w] is not None] for doc in docs]
+
+    def _lemma(self, w):
+        """Returns normal form of word or None if word should be dropped"""
+        key = (w, self._pos_key)
+        lemma = self.lemma_cache.get(key, key)
+        if lemma is not key:
+            return lemma
+
+        parsed = self.morph.parse(w)[0]
+        if parsed in resources.special_words():
+            lemma = None
+        elif self.allowed_pos and parsed.tag.POS not in self.allowed_pos:
+            lemma = None
+        else:
+            lemma = parsed.normal_form
+        self.lemma_cache.set(key, lemma)
+        return lemma
+
     def clear_stop_words(self, doc):
         """
         :param doc: iterable, list of words
@@ -236,13 +499,106 @@ class TextProcessing:  # TODO: add stemming
         """
         return [w for w in doc if w not in self.stop_words]
 
-    def transform(self, corpora: "pd.Series"):
+    def _transform_values(self, values):
+        tokens = [self.clear_stop_words(self.tokenize(doc)) for doc in values]
+        return self.lemmatize_batch(tokens)
+
+    @property
+    def config_key(self):
+        """Hex digest of parameters which affect transform results"""
+        params = dict(self._params)
+        token_pat = params["token_pat"]
+        params["token_pat"] = getattr(token_pat, "pattern", token_pat)
+        params["counter"] = sorted(params["counter"].items()) if self.mode == "nospace" else None
+        params["allowed_pos"] = sorted(params["allowed_pos"]) if params["allowed_pos"] else None
+        params["stop_words"] = sorted(params["stop_words"]) if params["stop_words"] else None
+        return hashlib.sha1(repr(sorted(params.items())).encode("utf-8")).hexdigest()
+
+    def _transform_ids_values(self, values):
+        """Same as _transform_values, but lemmas are encoded once per unique word"""
+        docs = [self.clear_stop_words(self.tokenize(doc)) for doc in values]
+        ids = {}
+        # first occurrence order, so ids are the same as encoding lemmas document by document
+        for w in dict.fromkeys(w for doc in docs for w in doc):
+            lemma = self._lemma(w)
+            if lemma is not None:
+                ids[w] = self.vocabulary.add(lemma)
+
+        indptr, indices = [0], []
+        for doc in docs:
+            indices.extend(ids[w] for w in doc if w in ids)
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32)
+
+    def transform_ids(self, corpora: "pd.Series", n_jobs=1, chunks_per_job=4, cache=None, post_ids=None):
+        """
+        Process full pipeline and encode lemmas with self.vocabulary
+        :param corpora: pd.Series to process
+        :param n_jobs: number of worker processes, -1 means all cores, 1 - no workers
+        :param chunks_per_job: corpora is split in n_jobs * chunks_per_job chunks to balance workers load
+        :param cache: PreprocessingCache, see transform
+        :param post_ids: see transform
+        :return: (indptr, indices) arrays, see Vocabulary.encode
+        """
+        if cache is None and (n_jobs == 1 or len(corpora) < 2):
+            return self._transform_ids_values(corpora.values)
+        return self.vocabulary.encode(self.transform(corpora, n_jobs, chunks_per_job, cache, post_ids).values)
+
+    def transform(self, corpora: "pd.Series", n_jobs=1, chunks_per_job=4, cache=None, post_ids=None):
         """
         Process full pipeline: tokenizing, deleting stopwords, lemmatizing
         :param corpora: pd.Series to process
+        :param n_jobs: number of worker processes, -1 means all cores, 1 - no workers
+        :param chunks_per_job: corpora is split in n_jobs * chunks_per_job chunks to balance workers load
+        :param cache: PreprocessingCache, if passed only posts missing in cache or changed since are processed,
+        cache is updated and saved
+        :param post_ids: iterable of unique post ids to key cache with, corpora index if None,
+        ValueError is raised if it is not unique
         :return: processed data
         """
-        data = (corpora.map(self.tokenize)
-                .map(self.clear_stop_words)
-                .map(self.lemmatize))
-        return data
+        if cache is not None:
+            return self._transform_cached(corpora, n_jobs, chunks_per_job, cache, post_ids)
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        if n_jobs == 1 or len(corpora) < 2:
+            return pd.Series(self._transform_values(corpora.values), index=corpora.index, name=corpora.name)
+
+        n_chunks = min(len(corpora), n_jobs * chunks_per_job)
+        bounds = np.linspace(0, len(corpora), n_chunks + 1).astype(int)
+        chunks = [corpora.values[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(self._params,)) as pool:
+            results = pool.map(_transform_chunk, chunks)  # keeps chunks order
+            data = [doc for chunk in results for doc in chunk]
+        return pd.Series(data, index=corpora.index, name=corpora.name)
+
+    def _transform_cached(self, corpora, n_jobs, chunks_per_job, cache, post_ids):
+        config = self.config_key
+        if post_ids is None and not corpora.index.is_unique:  # e.g. concatenated by files.merge_csv
+            raise ValueError("Corpora index is not unique, pass post_ids to key cache with")
+        post_ids = list(corpora.index if post_ids is None else post_ids)
+        if len(post_ids) != len(corpora) or len(set(post_ids)) != len(post_ids):
+            raise ValueError("Post_ids must be unique and match corpora length")
+        digests = [_doc_digest(doc) for doc in corpora.values]
+        data = cache.lookup(config, post_ids, digests)
+
+        missing = [i for i, doc in enumerate(data) if doc is None]
+        if missing:
+            processed = self.transform(corpora.iloc[missing], n_jobs, chunks_per_job).values
+            for i, doc in zip(missing, processed):
+                data[i] = doc
+            cache.update(config, [post_ids[i] for i in missing], [digests[i] for i in missing], processed)
+            cache.save(config)
+        return pd.Series(data, index=corpora.index, name=corpora.name)
+
+
+_WORKER = None
+
+
+def _init_worker(params):
+    """Builds TextProcessing with its MorphAnalyzer once per worker process"""
+    global _WORKER
+    _WORKER = TextProcessing(**params)
+
+
+def _transform_chunk(values):
+    return _WORKER._transform_values(values)
@@ -0,0 +1,89 @@
+"""
+Lazily loaded text processing resources.
+
+Cities, special words and stopwords are read on first use from csv files
+in the package 'data' folder and from the nltk corpus, then kept in memory
+and pickled as frozensets to 'data/resources.pickle', so next processes
+skip csv parsing and nltk corpus loading. Cached sets are rebuilt if csv files change.
+One MorphAnalyzer is shared by all TextProcessing instances of the process.
+"""
+
+
+import os
+import csv
+import pickle
+from functools import lru_cache
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+CACHE_FILE = os.path.join(DATA_DIR, "resources.pickle")
+SOURCES = {"cities": ("cities_.csv", ";"), "special_words": ("special_words.csv", ",")}
+
+
+def _read_words(file_name, sep):
+    """Reads second column of csv file with index in first column"""
+    with open(os.path.join(DATA_DIR, file_name), encoding="utf-8", newline="") as f:
+        return frozenset(row[1] for row in csv.reader(f, delimiter=sep) if row)
+
+
+def _read_stopwords():
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words("russian"))
+
+
+def _source_key(name):
+    """Modification time of csv source, stopwords come with nltk and never change"""
+    if name in SOURCES:
+        return os.path.getmtime(os.path.join(DATA_DIR, SOURCES[name][0]))
+    return None
+
+
+def _read_cache():
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+
+
+@lru_cache(maxsize=None)
+def _load(name):
+    """Returns word set by name, from pickled cache if it is up to date"""
+    key = _source_key(name)
+    cached = _read_cache()
+    if name in cached and cached[name][0] == key:
+        return cached[name][1]
+
+    words = _read_stopwords() if name == "stopwords" else _read_words(*SOURCES[name])
+    cached[name] = (key, words)
+    # written to temporary file and replaced, so other processes never read half-written cache
+    tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, CACHE_FILE)
+    except OSError:
+        pass  # read-only install, set is rebuilt next time
+    return words
+
+
+def cities():
+    """Returns frozenset of russian cities"""
+    return _load("cities")
+
+
+def special_words():
+    """Returns frozenset of words dropped by lemmatizing"""
+    return _load("special_words")
+
+
+def stopwords():
+    """Returns frozenset of russian stopwords from nltk"""
+    return _load("stopwords")
+
+
+@lru_cache(maxsize=None)
+def morph_analyzer():
+    """Returns MorphAnalyzer shared in process, its dictionaries are loaded on first call"""
+    from pymorphy2 import MorphAnalyzer
+    return MorphAnalyzer()
@@ -0,0 +1,139 @@
+"""
+Integer-encoded token documents and TF-IDF built straight from them.
+
+Corpus of tokenized documents is kept as CSR-style pair of arrays (indptr, indices):
+tokens of document i are indices[indptr[i]:indptr[i + 1]], every token is an id
+in a shared utils.vocabulary.Vocabulary. Such pairs are produced by
+Vocabulary.encode and TextProcessing.transform_ids and consumed by ArrayTfidfVectorizer.
+"""
+
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def concat_rows(*tokens):
+    """
+    Joins tokens of every document of several corpora, e.g. text and tags of the same posts
+    :param tokens: (indptr, indices) pairs with equal number of documents
+    :return: (indptr, indices) arrays, tokens of the first corpus go first in every document
+    """
+    lengths = [np.diff(indptr) for indptr, _ in tokens]
+    n_docs = len(lengths[0])
+    if any(len(l) != n_docs for l in lengths):
+        raise ValueError("All corpora must have the same number of documents")
+
+    rows = np.concatenate([np.repeat(np.arange(n_docs), l) for l in lengths])
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum(sum(lengths), out=indptr[1:])
+    return indptr, np.concatenate([indices for _, indices in tokens])[order]
+
+
+def filter_tokens(tokens, keep):
+    """
+    :param tokens: (indptr, indices) arrays
+    :param keep: boolean array indexed by token id, e.g. built from vocabulary items
+    :return: (indptr, indices) arrays without dropped tokens
+    """
+    return _select(tokens, np.asarray(keep)[tokens[1]])
+
+
+def _select(tokens, mask):
+    """Leaves tokens with True in mask, mask has one value per token occurrence"""
+    indptr, indices = tokens
+    kept = np.concatenate([[0], np.cumsum(mask)])
+    return kept[indptr], indices[mask]
+
+
+def counts_matrix(tokens, n_features):
+    """
+    :param tokens: (indptr, indices) arrays
+    :param n_features: number of columns, tokens with larger ids are ignored
+    :return: scipy.sparse.csr_matrix of token counts, documents x token ids
+    """
+    if len(tokens[1]) and tokens[1].max() >= n_features:
+        tokens = _select(tokens, tokens[1] < n_features)
+    indptr, indices = tokens
+    matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.float64), indices, indptr),
+                           shape=(len(indptr) - 1, n_features))
+    matrix.sum_duplicates()
+    return matrix
+
+
+class ArrayTfidfVectorizer:
+    """
+    TF-IDF over integer-encoded documents with the formula of sklearn TfidfVectorizer:
+    idf = ln((1 + n) / (1 + df)) + 1 with smooth_idf, rows are l2 normalized.
+    """
+
+    def __init__(self, max_df=1.0, min_df=1, smooth_idf=True, sublinear_tf=False, norm="l2"):
+        """
+        :param max_df: float share or int number of documents, more frequent tokens are dropped
+        :param min_df: float share or int number of documents, less frequent tokens are dropped
+        :param smooth_idf: add one to document frequencies, as if extra document contained every token
+        :param sublinear_tf: replace tf with 1 + log(tf)
+        :param norm: 'l2', 'l1' or None
+        """
+        self.max_df = max_df
+        self.min_df = min_df
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+
+    def fit(self, tokens, n_features=None):
+        """
+        :param tokens: (indptr, indices) arrays
+        :param n_features: vocabulary size, max token id + 1 if None
+        :return: self
+        """
+        self.fit_transform(tokens, n_features)
+        return self
+
+    def fit_transform(self, tokens, n_features=None):
+        """
+        :param tokens: (indptr, indices) arrays
+        :param n_features: vocabulary size, max token id + 1 if None
+        :return: scipy.sparse.csr_matrix, documents x kept tokens (see features_)
+        """
+        indptr, indices = tokens
+        if n_features is None:
+            n_features = int(indices.max()) + 1 if len(indices) else 0
+        counts = counts_matrix(tokens, n_features)
+
+        n_docs = counts.shape[0]
+        df = np.bincount(counts.indices, minlength=n_features)
+        max_df = self.max_df if isinstance(self.max_df, int) else self.max_df * n_docs
+        min_df = self.min_df if isinstance(self.min_df, int) else self.min_df * n_docs
+        # features_[column] is token id of column
+        self.features_ = np.flatnonzero((df >= min_df) & (df <= max_df))
+        df = df[self.features_]
+
+        smooth = int(self.smooth_idf)
+        self.idf_ = np.log((n_docs + smooth) / (df + smooth)) + 1
+        self.n_features_ = n_features
+        return self._weight(counts[:, self.features_])
+
+    def transform(self, tokens):
+        """
+        :param tokens: (indptr, indices) arrays, tokens unknown at fit are ignored
+        :return: scipy.sparse.csr_matrix, documents x kept tokens
+        """
+        counts = counts_matrix(tokens, self.n_features_)
+        return self._weight(counts[:, self.features_])
+
+    def _weight(self, counts):
+        counts = counts.tocsr()
+        if self.sublinear_tf:
+            np.log(counts.data, out=counts.data)
+            counts.data += 1
+        counts = counts @ sp.diags(self.idf_)
+        counts = counts.tocsr()
+        if self.norm is not None:
+            if self.norm == "l2":
+                norms = np.sqrt(counts.multiply(counts).sum(axis=1).A1)
+            else:
+                norms = abs(counts).sum(axis=1).A1
+            norms[norms == 0] = 1
+            counts = sp.diags(1 / norms) @ counts
+        return counts.tocsr()
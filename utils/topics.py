@@ -1,4 +1,8 @@
+from collections import deque
+
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
 
 TOPICS = {
@@ -19,39 +23,156 @@ TOPICS = {
 }
 
 
+class TopicMatcher:
+    """
+    Compiled topics: Aho-Corasick automaton over topic words for raw texts
+    and inverted word -> topics index for tokenized documents.
+    Recompile after TOPICS edit, compiling takes milliseconds.
+    """
+
+    def __init__(self, topics=None):
+        """
+        :param topics: dict topic -> set of words, TOPICS if None
+        """
+        topics = TOPICS if topics is None else topics
+        self.topics = list(topics)
+        self._index = {}
+        for t, words in enumerate(topics.values()):
+            for w in words:
+                self._index.setdefault(w, set()).add(t)
+        self._build_automaton()
+
+    def _build_automaton(self):
+        self._goto = [{}]
+        self._out = [frozenset()]
+        for w, tpcs in self._index.items():
+            state = 0
+            for ch in w:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = self._goto[state][ch] = len(self._goto)
+                    self._goto.append({})
+                    self._out.append(frozenset())
+                state = nxt
+            self._out[state] = self._out[state] | tpcs
+
+        # breadth first, so fail state of every node is ready before its children
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] | self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def text_topics(self, text):
+        """
+        :param text: str, topic matches if any of its words is a substring of text
+        :return: set of topic ids
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        res = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                res.update(out[state])
+        return res
+
+    def token_topics(self, tokens):
+        """
+        :param tokens: iterable of words, topic matches if any of its words is in tokens
+        :return: set of topic ids
+        """
+        res = set()
+        for w in tokens:
+            tpcs = self._index.get(w)
+            if tpcs:
+                res.update(tpcs)
+        return res
+
+    def _matrix(self, docs, doc_topics):
+        indptr, indices = [0], []
+        for doc in docs:
+            indices.extend(sorted(doc_topics(doc)))
+            indptr.append(len(indices))
+        return sp.csr_matrix((np.ones(len(indices), dtype=bool), np.array(indices, dtype=np.int32), indptr),
+                             shape=(len(indptr) - 1, len(self.topics)))
+
+    def match_texts(self, texts):
+        """
+        :param texts: iterable of str
+        :return: scipy.sparse.csr_matrix of shape n_texts x n_topics, True if text matches topic
+        """
+        return self._matrix(texts, self.text_topics)
+
+    def match_tokens(self, docs):
+        """
+        :param docs: iterable of token lists or sets (e.g. lemmatized texts or tags)
+        :return: scipy.sparse.csr_matrix of shape n_docs x n_topics, True if document matches topic
+        """
+        return self._matrix(docs, self.token_topics)
+
+    def to_frame(self, matrix, index=None):
+        """
+        :param matrix: result of match_texts or match_tokens
+        :param index: index of resulting frame, e.g. index of matched pd.Series
+        :return: boolean pd.DataFrame with topic columns
+        """
+        return pd.DataFrame(matrix.toarray(), index=index, columns=self.topics)
+
+    def topic_names(self, ids):
+        """Returns set of topic names by topic ids"""
+        return {self.topics[t] for t in ids}
+
+
+_MATCHER = None
+_MATCHER_KEY = None
+
+
+def compiled_topics():
+    """Returns TopicMatcher of TOPICS, it is recompiled if TOPICS was edited"""
+    global _MATCHER, _MATCHER_KEY
+    key = tuple((tpc, frozenset(words)) for tpc, words in TOPICS.items())
+    if key != _MATCHER_KEY:
+        _MATCHER, _MATCHER_KEY = TopicMatcher(), key
+    return _MATCHER
+
+
+def topics_frame(corpus: "pd.Series", tokens=True):
+    """
+    Matches whole corpus against TOPICS in one call
+    :param corpus: pd.Series of token lists / sets or of raw texts
+    :param tokens: True if corpus is tokenized, False for raw texts
+    :return: boolean pd.DataFrame with one column per topic and index of corpus
+    """
+    matcher = compiled_topics()
+    matrix = matcher.match_tokens(corpus.values) if tokens else matcher.match_texts(corpus.values)
+    return matcher.to_frame(matrix, corpus.index)
+
+
 def map_tag_topics(tags: "set"):
-    res = set()
-    for tpc, map_tags in TOPICS.items():
-        if map_tags & tags:
-            res.add(tpc)
-    return res
+    matcher = compiled_topics()
+    return matcher.topic_names(matcher.token_topics(tags))
 
 
 def map_text_topics(text):
-    res = set()
-    for tpc, words in TOPICS.items():
-        for w in words:
-            if w in text:
-                res.add(tpc)
-    return res
+    matcher = compiled_topics()
+    # as 'word in text': substring of str, element of list or set of tokens
+    topics = matcher.text_topics(text) if isinstance(text, str) else matcher.token_topics(text)
+    return matcher.topic_names(topics)
 
 
 def map_topics_set(tokens: set):
-    res = {key: [] for key in TOPICS}
-    for tpc, words in TOPICS.items():
-        if tokens & words:
-            res[tpc].append(1)
-        else:
-            res[tpc].append(0)
-    return pd.DataFrame(res)
+    matcher = compiled_topics()
+    return matcher.to_frame(matcher.match_tokens([tokens])).astype(int)
 
 
 def map_topics_list(tokens: list):
-    res = {key: [] for key in TOPICS}
-    for tpc, words in TOPICS.items():
-        for w in words:
-            if w in tokens and (w not in res[tpc]):
-                res[tpc].append(1)
-            else:
-                res[tpc].append(0)
-    return pd.DataFrame(res)
+    return map_topics_set(tokens)
@@ -0,0 +1,93 @@
+"""
+Growable mapping between hashable items (words, user names, post shortcodes)
+and consecutive integer ids.
+"""
+
+
+import os
+
+import numpy as np
+
+
+class Vocabulary:
+    """
+    Interns items as integer ids in order of appearance: 0, 1, 2...
+    """
+
+    def __init__(self, items=()):
+        self._index = {}
+        self._items = []
+        self.update(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, item):
+        """Returns id of item, new id is assigned if item is unknown"""
+        idx = self._index.get(item)
+        if idx is None:
+            idx = self._index[item] = len(self._items)
+            self._items.append(item)
+        return idx
+
+    def update(self, items):
+        """Returns list of ids of items, adding unknown ones"""
+        return [self.add(item) for item in items]
+
+    def get(self, item, default=None):
+        """Returns id of item or default if item is unknown"""
+        return self._index.get(item, default)
+
+    def item(self, idx):
+        """Returns item by its id"""
+        return self._items[idx]
+
+    def items(self, ids=None):
+        """Returns list of items by ids, all items if ids is None"""
+        if ids is None:
+            return list(self._items)
+        return [self._items[i] for i in ids]
+
+    def encode(self, docs):
+        """
+        Encodes tokenized documents as CSR-style arrays, see utils.tfidf
+        :param docs: iterable of token lists, unknown tokens are added
+        :return: (indptr, indices) arrays, tokens of document i are indices[indptr[i]:indptr[i + 1]]
+        """
+        indptr, indices = [0], []
+        for doc in docs:
+            indices.extend(self.update(doc))
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32)
+
+    def decode(self, tokens):
+        """
+        :param tokens: (indptr, indices) arrays made by encode
+        :return: list of token lists
+        """
+        indptr, indices = tokens
+        return [self.items(indices[start:stop]) for start, stop in zip(indptr[:-1], indptr[1:])]
+
+    def save(self, path, start=0):
+        """
+        Writes items one per line to text file
+        :param path: file path
+        :param start: id to start from, if > 0 items are appended to existing file
+        """
+        with open(path, "a" if start else "w", encoding="utf-8") as f:
+            for item in self._items[start:]:
+                f.write(f"{item}\n")
+
+    @classmethod
+    def load(cls, path):
+        """Reads vocabulary saved by Vocabulary.save, empty vocabulary if file does not exist"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            return cls(line.rstrip("\n") for line in f)